@@ -5,3 +5,6 @@ class ApiConfig(AppConfig):
     """Конфигурация приложения api"""
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from . import signals  # noqa: F401
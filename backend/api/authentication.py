@@ -0,0 +1,29 @@
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+
+
+def get_token_cache_key(key):
+    """Ключ кэша для токена: сам токен в кэш не попадает"""
+    return f'auth:token:{sha256(key.encode()).hexdigest()}'
+
+
+def invalidate_token(key):
+    """Удаляет токен из кэша аутентификации"""
+    cache.delete(get_token_cache_key(key))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Аутентификация по токену c кэшированием токена и пользователя
+    на TOKEN_CACHE_TIMEOUT секунд. Кэш сбрасывается при удалении токена
+    (выход) и любом сохранении пользователя (смена пароля, блокировка)"""
+
+    def authenticate_credentials(self, key):
+        cache_key = get_token_cache_key(key)
+        token = cache.get(cache_key)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set(cache_key, token, settings.TOKEN_CACHE_TIMEOUT)
+        return token.user, token
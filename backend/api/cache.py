@@ -0,0 +1,140 @@
+from hashlib import md5
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from recipes.versions import (
+    bump_version as bump_key_version,
+    get_version as get_data_version,
+    increment as increment_key
+)
+
+VERSION_KEY = 'recipes:version'
+HITS_KEY = 'recipes:hits'
+MISSES_KEY = 'recipes:misses'
+USER_VERSION_KEY = 'user:{}:version'
+
+
+def get_cache():
+    """Возвращает бэкенд кэша ответов API"""
+    return caches[settings.API_CACHE_ALIAS]
+
+
+def increment(key):
+    """Атомарно увеличивает счетчик в кэше ответов"""
+    return increment_key(key, get_cache())
+
+
+def get_version():
+    """Возвращает текущую версию данных рецептов"""
+    return get_data_version(VERSION_KEY, get_cache())
+
+
+def bump_version():
+    """Сбрасывает закэшированные ответы после фиксации транзакции"""
+    bump_key_version(VERSION_KEY, get_cache())
+
+
+def get_user_version(user_id):
+    """Возвращает версию избранного и корзины пользователя"""
+    return get_data_version(USER_VERSION_KEY.format(user_id), get_cache())
+
+
+def bump_user_version(user_id):
+    """Меняет версию избранного и корзины пользователя
+    после фиксации транзакции"""
+    bump_key_version(USER_VERSION_KEY.format(user_id), get_cache())
+
+
+def get_stats():
+    """Возвращает счетчики попаданий и промахов кэша"""
+    cache = get_cache()
+    return {
+        'version': get_version(),
+        'hits': cache.get(HITS_KEY, 0),
+        'misses': cache.get(MISSES_KEY, 0),
+    }
+
+
+def make_key(request):
+    """Ключ кэша: версия, путь и отсортированные параметры запроса"""
+    query = urlencode(sorted(
+        (name, value)
+        for name, values in request.query_params.lists()
+        for value in values))
+    return f'recipes:{get_version()}:{request.path}?{query}'
+
+
+class AnonymousCacheMixin:
+    """Миксин кэширования ответов list и retrieve для анонимов"""
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return handler(request, *args, **kwargs)
+        cache = get_cache()
+        key = make_key(request)
+        data = cache.get(key)
+        if data is not None:
+            increment(HITS_KEY)
+            return Response(data)
+        increment(MISSES_KEY)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, settings.API_CACHE_TIMEOUT)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+
+def make_etag(*parts):
+    """Строит ETag из версий данных и адреса запроса"""
+    return '"{}"'.format(
+        md5(':'.join(map(str, parts)).encode()).hexdigest())
+
+
+class ConditionalMixin:
+    """Миксин условных запросов для list и retrieve. ETag строится
+    из версий данных без обращения к базе, при совпадении c If-None-Match
+    возвращается 304 без выборки и сериализации"""
+    cache_control = {'private': True, 'no_cache': True}
+    vary_headers = ('Authorization',)
+
+    def get_etag_parts(self, request):
+        raise NotImplementedError
+
+    def get_conditional_response(self, handler, request, *args, **kwargs):
+        etag = make_etag(
+            *self.get_etag_parts(request), request.get_full_path())
+        client_etags = {
+            tag[2:] if tag.startswith('W/') else tag
+            for tag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))}
+        if etag in client_etags:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (
+                status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            patch_cache_control(response, **self.cache_control)
+            if self.vary_headers:
+                patch_vary_headers(response, self.vary_headers)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.get_conditional_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_conditional_response(
+            super().retrieve, request, *args, **kwargs)
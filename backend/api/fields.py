@@ -1,8 +1,12 @@
 import base64
 
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from rest_framework import serializers
 
+from recipes.images import SOURCE_KEY
+from recipes.search import render_snippet
+
 
 class Base64ImageField(serializers.ImageField):
     """Кастомное поле преобразующее Base64 в изображение для сохранения"""
@@ -15,3 +19,20 @@ class Base64ImageField(serializers.ImageField):
 
     def to_representation(self, value):
         return value
+
+
+class RenditionsField(serializers.ReadOnlyField):
+    """Поле со ссылками на уменьшенные копии изображения"""
+    def to_representation(self, renditions):
+        request = self.context.get('request')
+        return {
+            key: (request.build_absolute_uri(default_storage.url(name))
+                  if request else default_storage.url(name))
+            for key, name in renditions.items() if key != SOURCE_KEY}
+
+
+class SnippetField(serializers.ReadOnlyField):
+    """Фрагмент описания c выделенными совпадениями поиска,
+    текст рецепта экранирован"""
+    def to_representation(self, snippet):
+        return render_snippet(snippet)
@@ -1,32 +1,96 @@
+from django import forms
+from django.conf import settings
+from django.db.models import Case, Count, Exists, OuterRef, When
 from django_filters import (
+    ChoiceFilter,
+    Filter,
     ModelChoiceFilter,
-    ModelMultipleChoiceFilter,
     NumberFilter
 )
 from django_filters.rest_framework import CharFilter, FilterSet
 
-from recipes.models import Ingredient, Recipe, Tag, User
+from recipes.models import Ingredient, Recipe, User
+from recipes.search import get_recipe_search, ingredient_index
+from recipes.tags import tag_slugs
+
+USER_RECIPES = {
+    'is_favorited': 'favorites', 'is_in_shopping_cart': 'cart_items'}
+TAGS_MODES = (('any', 'Любой из тегов'), ('all', 'Все теги'))
+
+
+class MultipleValueField(forms.MultipleChoiceField):
+    """Поле списка значений без проверки по вариантам выбора"""
+
+    def valid_value(self, value):
+        return True
+
+
+class MultipleValueFilter(Filter):
+    """Фильтр по нескольким значениям одного параметра запроса"""
+    field_class = MultipleValueField
 
 
 class RecipeFilter(FilterSet):
-    """Фильтр рецептов по избранному, корзине, автору и тегам"""
-    is_favorited = NumberFilter()
-    is_in_shopping_cart = NumberFilter()
+    """Фильтр рецептов по избранному, корзине, автору, тегам
+    и полнотекстовый поиск"""
+    is_favorited = NumberFilter(method='filter_user_recipes')
+    is_in_shopping_cart = NumberFilter(method='filter_user_recipes')
     author = ModelChoiceFilter(queryset=User.objects.all(), to_field_name='id')
-    tags = ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
-    )
+    tags = MultipleValueFilter(method='filter_tags')
+    tags_mode = ChoiceFilter(choices=TAGS_MODES, method='filter_tags_mode')
+    search = CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
         fields = ('is_favorited', 'is_in_shopping_cart', 'author', 'tags')
 
+    def filter_user_recipes(self, recipes, name, value):
+        """Отбирает рецепты по записям пользователя в избранном или
+        корзине подзапросом IN, который база начинает c малой стороны"""
+        user = self.request.user
+        if not user.is_authenticated:
+            return recipes.none() if value else recipes
+        user_recipes = getattr(user, USER_RECIPES[name]).values('recipe_id')
+        if value:
+            return recipes.filter(id__in=user_recipes)
+        return recipes.exclude(id__in=user_recipes)
+
+    def filter_tags(self, recipes, name, value):
+        """Отбирает рецепты c любым или со всеми тегами подзапросом
+        к промежуточной таблице, без JOIN и DISTINCT"""
+        if not value:
+            return recipes
+        slugs = set(value)
+        tag_ids = tag_slugs.get_ids(slugs)
+        recipe_tags = Recipe.tags.through.objects.filter(tag_id__in=tag_ids)
+        if self.form.cleaned_data.get('tags_mode') != 'all':
+            if not tag_ids:
+                return recipes.none()
+            return recipes.filter(
+                Exists(recipe_tags.filter(recipe_id=OuterRef('pk'))))
+        if len(tag_ids) < len(slugs):
+            return recipes.none()
+        return recipes.filter(id__in=(
+            recipe_tags
+            .values('recipe_id')
+            .annotate(tags_count=Count('tag_id'))
+            .filter(tags_count=len(tag_ids))
+            .values('recipe_id')))
+
+    def filter_tags_mode(self, recipes, name, value):
+        """Режим учитывается в filter_tags"""
+        return recipes
+
+    def filter_search(self, recipes, name, value):
+        value = value.strip()
+        if not value:
+            return recipes
+        return get_recipe_search().search(recipes, value)
+
 
 class IngredientFilter(FilterSet):
     """Фильтр ингредиентов по началу названия
-    и совпадению в произвольном месте"""
+    и совпадению в произвольном месте через индекс в памяти"""
     name = CharFilter(method='filter_name')
 
     class Meta:
@@ -34,8 +98,10 @@ class IngredientFilter(FilterSet):
         fields = ('name',)
 
     def filter_name(self, ingredients, name, value):
-        if value:
-            return (ingredients.filter(name__istartswith=value)
-                    | ingredients.filter(name__icontains=value)
-                    .exclude(name__istartswith=value))
-        return ingredients
+        if not value:
+            return ingredients
+        ids = ingredient_index.search(value, settings.INGREDIENT_SEARCH_LIMIT)
+        if not ids:
+            return ingredients.none()
+        return ingredients.filter(id__in=ids).order_by(Case(
+            *(When(id=pk, then=position) for position, pk in enumerate(ids))))
@@ -0,0 +1,201 @@
+import base64
+import json
+import math
+from io import BytesIO
+from timeit import default_timer
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe, Tag, User
+
+BASELINE_PATH = settings.BASE_DIR / 'benchmarks' / 'baseline.json'
+PERCENTILES = (50, 95, 99)
+
+
+def get_percentile(values, percentile):
+    """Перцентиль по методу ближайшего ранга"""
+    values = sorted(values)
+    return values[max(math.ceil(percentile / 100 * len(values)) - 1, 0)]
+
+
+def get_image():
+    """Небольшое изображение в base64 для создания рецепта"""
+    buffer = BytesIO()
+    Image.new('RGB', (32, 32), 'green').save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+class Command(BaseCommand):
+    help = ('Сценарии нагрузки на API: перцентили времени ответа '
+            'и число SQL-запросов, сравнение c базовой линией')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument(
+            '--username', default='benchmark0',
+            help='Пользователь, от имени которого идут запросы')
+        parser.add_argument(
+            '--scenario', action='append',
+            help='Запустить только указанные сценарии')
+        parser.add_argument('--baseline', default=str(BASELINE_PATH))
+        parser.add_argument(
+            '--save-baseline', action='store_true',
+            help='Сохранить результаты как базовую линию')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.5,
+            help='Допустимый рост p50 относительно базовой линии')
+
+    def get_scenarios(self, user):
+        """Сценарии: метод, адрес, параметры и тело запроса"""
+        recipe = user.recipes.order_by('id').first()
+        if recipe is None:
+            raise CommandError(f'У пользователя {user} нет рецептов')
+        tags = list(Tag.objects.order_by('id').values_list('slug', 'id'))
+        ingredients = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True)[:5])
+        body = {
+            'name': 'Рецепт для нагрузочного теста',
+            'text': 'Описание рецепта для нагрузочного теста',
+            'cooking_time': 30,
+            'tags': [pk for _, pk in tags[:2]],
+        }
+
+        def ingredients_body(amount):
+            return {**body, 'ingredients': [
+                {'id': pk, 'amount': amount} for pk in ingredients]}
+
+        updates = iter(range(1, 10 ** 9))
+        return {
+            'feed': lambda: ('get', '/api/recipes/', {'limit': 6}),
+            'feed_filtered': lambda: ('get', '/api/recipes/', {
+                'tags': [slug for slug, _ in tags[:2]], 'is_favorited': 0}),
+            'feed_favorited': lambda: (
+                'get', '/api/recipes/', {'is_favorited': 1}),
+            'feed_search': lambda: ('get', '/api/recipes/', {'search': 'суп'}),
+            'subscription_feed': lambda: ('get', '/api/recipes/feed/', {}),
+            'similar_recipes': lambda: (
+                'get', f'/api/recipes/{recipe.id}/similar/', {}),
+            'subscriptions': lambda: (
+                'get', '/api/users/subscriptions/', {'recipes_limit': 3}),
+            'download_shopping_cart': lambda: (
+                'get', '/api/recipes/download_shopping_cart/', {}),
+            'ingredient_autocomplete': lambda: (
+                'get', '/api/ingredients/', {'name': 'сол'}),
+            'recipe_create': lambda: ('post', '/api/recipes/', {
+                **ingredients_body(10), 'image': get_image()}),
+            'recipe_update': lambda: (
+                'patch', f'/api/recipes/{recipe.id}/',
+                ingredients_body(next(updates))),
+        }
+
+    def request(self, client, method, path, data):
+        """Выполняет запрос и дочитывает ответ, включая потоковый"""
+        if method == 'get':
+            response = client.get(path, data)
+        else:
+            response = getattr(client, method)(
+                path, json.dumps(data), content_type='application/json')
+        if response.streaming:
+            b''.join(response.streaming_content)
+        else:
+            response.content
+        return response
+
+    def run_scenario(self, client, scenario, repeat):
+        """Прогрев и repeat замеров, возвращает перцентили и запросы"""
+        timings, queries, created = [], [], []
+        for index in range(repeat + 1):
+            method, path, data = scenario()
+            with CaptureQueriesContext(connection) as captured:
+                start = default_timer()
+                response = self.request(client, method, path, data)
+                seconds = default_timer() - start
+            if response.status_code >= 400:
+                raise CommandError(
+                    f'{method.upper()} {path}: {response.status_code} '
+                    f'{response.content[:200]}')
+            if method == 'post':
+                created.append(response.json()['id'])
+            if index:
+                timings.append(seconds * 1000)
+                queries.append(len(captured))
+        for recipe in Recipe.objects.filter(id__in=created):
+            recipe.delete()
+        result = {
+            f'p{percentile}': round(get_percentile(timings, percentile), 3)
+            for percentile in PERCENTILES}
+        result['queries'] = max(queries)
+        return result
+
+    def compare(self, results, baseline, tolerance):
+        """Список регрессий относительно базовой линии: число запросов
+        и медиана, хвостовые перцентили только выводятся"""
+        regressions = []
+        for name, result in results.items():
+            expected = baseline.get(name)
+            if expected is None:
+                regressions.append(f'{name}: нет в базовой линии')
+                continue
+            if result['queries'] > expected['queries']:
+                regressions.append(
+                    f'{name}: запросов {result["queries"]} '
+                    f'вместо {expected["queries"]}')
+            if result['p50'] > expected['p50'] * (1 + tolerance):
+                regressions.append(
+                    f'{name}: p50 {result["p50"]} мс '
+                    f'вместо {expected["p50"]} мс')
+        return regressions
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['username']).first()
+        if user is None:
+            raise CommandError(
+                f'Нет пользователя {options["username"]}, '
+                'сначала выполните generate_data')
+        token, _ = Token.objects.get_or_create(user=user)
+        client = Client(
+            HTTP_AUTHORIZATION=f'Token {token.key}', HTTP_HOST='localhost')
+        scenarios = self.get_scenarios(user)
+        names = options['scenario'] or scenarios
+        unknown = set(names) - set(scenarios)
+        if unknown:
+            raise CommandError(f'Неизвестные сценарии: {sorted(unknown)}')
+        self.stdout.write(
+            f'База: {connection.vendor}, рецептов: {Recipe.objects.count()}, '
+            f'повторов: {options["repeat"]}')
+        results = {}
+        for name in names:
+            result = self.run_scenario(
+                client, scenarios[name], options['repeat'])
+            results[name] = result
+            self.stdout.write(
+                f'{name:<24} p50 {result["p50"]:8.2f} мс  '
+                f'p95 {result["p95"]:8.2f} мс  p99 {result["p99"]:8.2f} мс  '
+                f'запросов {result["queries"]}')
+        if options['save_baseline']:
+            with open(options['baseline'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+                file.write('\n')
+            self.stdout.write(self.style.SUCCESS(
+                f'Базовая линия сохранена в {options["baseline"]}'))
+            return
+        try:
+            with open(options['baseline'], encoding='utf-8') as file:
+                baseline = json.load(file)
+        except FileNotFoundError:
+            self.stdout.write(self.style.WARNING(
+                f'Базовая линия {options["baseline"]} не найдена'))
+            return
+        regressions = self.compare(results, baseline, options['tolerance'])
+        if regressions:
+            raise CommandError(
+                'Регрессии относительно базовой линии:\n'
+                + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
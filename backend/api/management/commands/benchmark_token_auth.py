@@ -0,0 +1,60 @@
+from timeit import default_timer
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from api.authentication import CachedTokenAuthentication, invalidate_token
+from recipes.models import User
+
+
+class Command(BaseCommand):
+    help = 'Сравнение аутентификации по токену c кэшем и без него'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=1000)
+
+    def measure(self, authentication, key, repeat):
+        """Среднее время и число запросов к БД на одну аутентификацию"""
+        with CaptureQueriesContext(connection) as queries:
+            start = default_timer()
+            for _ in range(repeat):
+                authentication.authenticate_credentials(key)
+            seconds = default_timer() - start
+        return seconds / repeat * 1000, len(queries) / repeat
+
+    def count_request_queries(self, key):
+        """Число запросов к БД при GET /api/recipes/"""
+        client = Client(
+            HTTP_AUTHORIZATION=f'Token {key}', HTTP_HOST='localhost')
+        with CaptureQueriesContext(connection) as queries:
+            client.get('/api/recipes/')
+        return len(queries)
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        with transaction.atomic():
+            user = User.objects.create_user(
+                username='benchmark-token-auth',
+                email='benchmark-token-auth@example.com',
+                first_name='Benchmark', last_name='Benchmark')
+            key = Token.objects.create(user=user).key
+            for name, authentication in (
+                ('TokenAuthentication', TokenAuthentication()),
+                ('CachedTokenAuthentication', CachedTokenAuthentication()),
+            ):
+                milliseconds, queries = self.measure(
+                    authentication, key, repeat)
+                self.stdout.write(
+                    f'{name}: {milliseconds:.3f} мс, '
+                    f'{queries:.2f} запросов на аутентификацию')
+            invalidate_token(key)
+            self.stdout.write(
+                f'GET /api/recipes/: холодный кэш '
+                f'{self.count_request_queries(key)} запросов, '
+                f'прогретый {self.count_request_queries(key)} запросов')
+            invalidate_token(key)
+            transaction.set_rollback(True)
@@ -0,0 +1,199 @@
+import logging
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+METRICS = {
+    'api_request_duration_seconds': (
+        'Время обработки запроса', DURATION_BUCKETS),
+    'api_db_queries': ('Число SQL-запросов за запрос', QUERY_BUCKETS),
+    'api_db_duration_seconds': (
+        'Время выполнения SQL-запросов за запрос', DURATION_BUCKETS),
+    'api_serialization_duration_seconds': (
+        'Время работы представления DRF без SQL, включая сериализацию '
+        'и отрисовку ответа', DURATION_BUCKETS),
+    'api_response_size_bytes': ('Размер тела ответа', SIZE_BUCKETS),
+}
+FINGERPRINT_PATTERNS = (
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+\b'), '?'),
+    (re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)'), '(...)'),
+)
+
+
+def get_fingerprint(sql):
+    """Отпечаток SQL-запроса без литералов и длины списков IN"""
+    for pattern, replacement in FINGERPRINT_PATTERNS:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+def get_view_name(request):
+    """Имя представления для меток метрик: класс и действие DRF
+    или имя маршрута Django"""
+    match = request.resolver_match
+    if match is None:
+        return None
+    view_class = getattr(match.func, 'cls', None)
+    if view_class is None:
+        return match.view_name
+    actions = getattr(match.func, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f'{view_class.__name__}.{action}'
+
+
+class Histogram:
+    """Гистограмма c фиксированными границами корзин"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def export(self, name, view):
+        total = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            total += count
+            yield f'{name}_bucket{{view="{view}",le="{bound}"}} {total}'
+        yield f'{name}_sum{{view="{view}"}} {self.sum}'
+        yield f'{name}_count{{view="{view}"}} {total}'
+
+
+class MetricsRegistry:
+    """Гистограммы по представлениям в памяти процесса.
+    Каждый процесс gunicorn отдает собственные значения"""
+
+    def __init__(self):
+        self.histograms = {name: {} for name in METRICS}
+        self.lock = threading.Lock()
+
+    def observe(self, view, values):
+        with self.lock:
+            for name, value in values.items():
+                if value is None:
+                    continue
+                histograms = self.histograms[name]
+                if view not in histograms:
+                    histograms[view] = Histogram(METRICS[name][1])
+                histograms[view].observe(value)
+
+    def export(self):
+        """Метрики в текстовом формате Prometheus"""
+        lines = []
+        with self.lock:
+            for name, histograms in self.histograms.items():
+                lines.append(f'# HELP {name} {METRICS[name][0]}')
+                lines.append(f'# TYPE {name} histogram')
+                for view, histogram in sorted(histograms.items()):
+                    lines.extend(histogram.export(name, view))
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class QueryRecorder:
+    """Обертка выполнения SQL: считает запросы, их время и отпечатки"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+        self.fingerprints = Counter()
+        self.handler_started = None
+        self.serialization = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += perf_counter() - start
+            self.count += 1
+            self.fingerprints[get_fingerprint(sql)] += 1
+
+    def get_duplicates(self):
+        """Отпечатки запросов, выполненных больше одного раза"""
+        return [
+            (count, fingerprint)
+            for fingerprint, count in self.fingerprints.most_common()
+            if count > 1]
+
+
+class QueryMetricsMiddleware:
+    """Собирает по каждому представлению число и время SQL-запросов,
+    время и размер ответа и пишет в журнал запросы сверх бюджета.
+    Запросы из итератора потокового ответа не учитываются"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        request.query_metrics = recorder
+        start = perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        duration = perf_counter() - start
+        view = get_view_name(request)
+        if view is None:
+            return response
+        registry.observe(view, {
+            'api_request_duration_seconds': duration,
+            'api_db_queries': recorder.count,
+            'api_db_duration_seconds': recorder.duration,
+            'api_serialization_duration_seconds': recorder.serialization,
+            'api_response_size_bytes': (
+                None if response.streaming else len(response.content)),
+        })
+        if (recorder.count > settings.API_QUERY_BUDGET
+                or duration > settings.API_LATENCY_BUDGET):
+            logger.warning(
+                'Превышен бюджет запроса %s %s (%s): %d SQL-запросов '
+                'за %.3f с, всего %.3f с. Повторяющиеся запросы: %s',
+                request.method, request.get_full_path(), view,
+                recorder.count, recorder.duration, duration,
+                recorder.get_duplicates() or 'нет')
+        return response
+
+
+class SerializationMetricsMixin:
+    """Миксин представлений DRF: измеряет время работы обработчика
+    без SQL-запросов вместе c отрисовкой ответа.
+    Работает только вместе c QueryMetricsMiddleware"""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        recorder = getattr(request, 'query_metrics', None)
+        if recorder is not None:
+            recorder.handler_started = (perf_counter(), recorder.duration)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs)
+        recorder = getattr(request, 'query_metrics', None)
+        if recorder is None or recorder.handler_started is None:
+            return response
+        if hasattr(response, 'render'):
+            response.render()
+        started, db_duration = recorder.handler_started
+        recorder.serialization = (
+            perf_counter() - started - (recorder.duration - db_duration))
+        return response
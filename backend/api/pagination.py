@@ -1,7 +1,106 @@
-from rest_framework.pagination import PageNumberPagination
+from base64 import b64decode, b64encode
+from datetime import datetime
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    CursorPagination,
+    PageNumberPagination,
+    _positive_int
+)
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetCursorPagination(CursorPagination):
+    """Keyset-пагинация по полям сортировки без OFFSET и COUNT(*)"""
+    page_size_query_param = 'limit'
+    page_size = 6
+
+    def decode_cursor(self, request):
+        """Пустой параметр cursor означает первую страницу"""
+        if not request.query_params.get(self.cursor_query_param):
+            return None
+        return super().decode_cursor(request)
 
 
 class LimitPageNumberPagination(PageNumberPagination):
-    """Пагинация с настраиваемым лимитом"""
+    """Пагинация с настраиваемым лимитом и опциональным режимом курсора.
+    Курсор включается параметром cursor, если у view задан cursor_ordering"""
+    page_size_query_param = 'limit'
+    page_size = 6
+    cursor_query_param = 'cursor'
+
+    def __init__(self):
+        self.cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = getattr(view, 'cursor_ordering', None)
+        if ordering and self.cursor_query_param in request.query_params:
+            self.cursor_paginator = KeysetCursorPagination()
+            self.cursor_paginator.ordering = ordering
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class TimelinePagination:
+    """Keyset-пагинация ленты вперед по позициям (pub_date, id).
+    Позиции страницы выбирает функция get_positions(limit, before)"""
+    cursor_query_param = 'cursor'
     page_size_query_param = 'limit'
     page_size = 6
+    invalid_cursor_message = 'Неверный курсор'
+
+    def __init__(self):
+        self.request = None
+        self.next_position = None
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True)
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            pub_date, pk = b64decode(encoded.encode()).decode().split('|')
+            return datetime.fromisoformat(pub_date), int(pk)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position):
+        pub_date, pk = position
+        return b64encode(f'{pub_date.isoformat()}|{pk}'.encode()).decode()
+
+    def paginate_positions(self, get_positions, request):
+        """id рецептов текущей страницы в порядке ленты"""
+        self.request = request
+        page_size = self.get_page_size(request)
+        positions = get_positions(page_size + 1, self.decode_cursor(request))
+        if len(positions) > page_size:
+            self.next_position = positions[page_size - 1]
+        return [pk for _, pk in positions[:page_size]]
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param,
+            self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data,
+        })
@@ -1,48 +1,64 @@
 from collections import Counter
 
+from django.db import transaction
 from djoser.serializers import UserSerializer as DjoserUserSerializer
 from rest_framework import serializers
 
-from recipes.constants import MIN_INGREDIENT_AMOUNT
+from recipes.constants import MAX_BULK_ITEMS, MIN_INGREDIENT_AMOUNT
 from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag, User
-from .fields import Base64ImageField
+from recipes.shopping_list import update_recipe_in_shopping_lists
+from .fields import Base64ImageField, RenditionsField, SnippetField
 
 
 class UserSerializer(DjoserUserSerializer):
     """Сериализатор пользователя с подпиской"""
     is_subscribed = serializers.BooleanField(default=False, read_only=True)
+    avatar_renditions = RenditionsField()
 
     class Meta(DjoserUserSerializer.Meta):
         model = User
-        fields = (*DjoserUserSerializer.Meta.fields, 'is_subscribed', 'avatar')
+        fields = (*DjoserUserSerializer.Meta.fields,
+                  'is_subscribed', 'avatar', 'avatar_renditions')
 
 
 class RecipeShortSerializer(serializers.ModelSerializer):
     """Сериализатор для вывода краткой информации о рецепте"""
+    image_renditions = RenditionsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_renditions', 'cooking_time')
         read_only_fields = fields
 
 
 class UserWithRecipesSerializer(UserSerializer):
     """Сериализатор пользователя с рецептами"""
-    recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(
-        source='recipes.count', read_only=True)
+    recipes = RecipeShortSerializer(many=True, read_only=True)
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta(UserSerializer.Meta):
         fields = (*UserSerializer.Meta.fields, 'recipes', 'recipes_count')
 
-    def get_recipes(self, obj):
-        """Получает рецепты с учетом лимита"""
-        return RecipeShortSerializer(
-            obj.recipes.all()[:int(
-                self.context['request'].GET.get('recipes_limit', 10**10)
-            )],
-            many=True,
-            context=self.context
-        ).data
+
+class BulkIdsSerializer(serializers.Serializer):
+    """Сериализатор списка id для пакетных операций"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BULK_ITEMS)
+
+    def validate_ids(self, ids):
+        """Убирает повторы, сохраняя порядок"""
+        return list(dict.fromkeys(ids))
+
+
+class IngredientsQuerySerializer(serializers.Serializer):
+    """Сериализатор параметров поиска рецептов по имеющимся продуктам"""
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BULK_ITEMS)
+    max_missing = serializers.IntegerField(min_value=0, required=False)
 
 
 class AvatarSerializer(serializers.ModelSerializer):
@@ -92,37 +108,86 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         source='recipe_ingredients', many=True, read_only=True)
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
+    image_renditions = RenditionsField()
+    search_snippet = SnippetField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
-                  'name', 'image', 'text', 'cooking_time')
+                  'name', 'image', 'image_renditions', 'text', 'cooking_time',
+                  'search_snippet')
         read_only_fields = fields
 
-    def check_status(self, recipe, related_name):
+    def get_user_recipe_ids(self, related_name):
+        """Возвращает id рецептов из связи пользователя одним запросом
+        для всех сериализуемых объектов"""
+        root = self.parent or self
+        if not hasattr(root, 'user_recipe_ids'):
+            root.user_recipe_ids = {}
+        if related_name not in root.user_recipe_ids:
+            recipes = root.instance
+            if isinstance(recipes, Recipe):
+                recipes = (recipes,)
+            root.user_recipe_ids[related_name] = set(
+                getattr(self.context['request'].user, related_name)
+                .filter(recipe__in=[recipe.id for recipe in recipes])
+                .values_list('recipe_id', flat=True))
+        return root.user_recipe_ids[related_name]
+
+    def check_status(self, recipe, annotation, related_name):
+        """Берет статус из аннотации queryset, а для объектов без нее
+        (ответы на создание и изменение) делает общий запрос"""
+        status = getattr(recipe, annotation, None)
+        if status is not None:
+            return status
         user = self.context['request'].user
-        return user.is_authenticated and getattr(user, related_name).filter(
-            recipe=recipe).exists()
+        return user.is_authenticated and (
+            recipe.id in self.get_user_recipe_ids(related_name))
 
     def get_is_favorited(self, recipe):
-        return self.check_status(recipe, 'favorites')
+        return self.check_status(recipe, 'is_favorited', 'favorites')
 
     def get_is_in_shopping_cart(self, recipe):
-        return self.check_status(recipe, 'cart_items')
+        return self.check_status(
+            recipe, 'is_in_shopping_cart', 'cart_items')
 
 
 class IngredientInRecipeReadSerializer(serializers.Serializer):
     """Сериализатор ингредиента для записи"""
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = serializers.IntegerField()
     amount = serializers.IntegerField(min_value=MIN_INGREDIENT_AMOUNT)
 
 
+class RecipeCoverageSerializer(RecipeReadSerializer):
+    """Сериализатор рецепта c числом имеющихся и недостающих продуктов"""
+    matched_ingredients = serializers.IntegerField(read_only=True)
+    missing_ingredients = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeReadSerializer.Meta):
+        fields = (*RecipeReadSerializer.Meta.fields,
+                  'matched_ingredients', 'missing_ingredients')
+        read_only_fields = fields
+
+
+def set_prefetched(instance, name, objects):
+    """Кладет уже загруженные связанные объекты в кэш prefetch_related,
+    чтобы сериализатор чтения не запрашивал их повторно"""
+    if not hasattr(instance, '_prefetched_objects_cache'):
+        instance._prefetched_objects_cache = {}
+    instance._prefetched_objects_cache.pop(name, None)
+    queryset = getattr(instance, name).all()
+    queryset._result_cache = list(objects)
+    queryset._prefetch_done = True
+    instance._prefetched_objects_cache[name] = queryset
+
+
 class RecipeWriteSerializer(serializers.ModelSerializer):
-    """Сериализатор создания и изменения рецепта"""
+    """Сериализатор создания и изменения рецепта.
+    Записывает только изменившиеся теги и продукты"""
     ingredients = IngredientInRecipeReadSerializer(many=True, required=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(), many=True, required=True)
+    tags = serializers.ListField(
+        child=serializers.IntegerField(), required=True)
     image = Base64ImageField(required=False)
 
     class Meta:
@@ -142,16 +207,30 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                 f'В списке {name} имеются дубликаты: {duplicates}')
         return items
 
+    def get_objects(self, model, ids, name):
+        """Загружает объекты по списку id одним запросом"""
+        objects = model.objects.in_bulk(ids)
+        missing = [pk for pk in ids if pk not in objects]
+        if missing:
+            raise serializers.ValidationError(
+                f'В списке {name} есть несуществующие id: {missing}')
+        return objects
+
     def validate_ingredients(self, ingredients):
-        """Проверка: ингредиенты не пустые и уникальные"""
-        self.items_validate(
-            [ingredient['id'].id for ingredient in ingredients],
-            'ингредиентов')
-        return ingredients
+        """Проверка: ингредиенты не пустые, уникальные и существуют"""
+        ids = self.items_validate(
+            [ingredient['id'] for ingredient in ingredients], 'ингредиентов')
+        objects = self.get_objects(Ingredient, ids, 'ингредиентов')
+        return [
+            {'ingredient': objects[ingredient['id']],
+             'amount': ingredient['amount']}
+            for ingredient in ingredients]
 
     def validate_tags(self, tags):
-        """Проверка: теги не пустые и уникальные"""
-        return self.items_validate(tags, 'тегов')
+        """Проверка: теги не пустые, уникальные и существуют"""
+        objects = self.get_objects(
+            Tag, self.items_validate(tags, 'тегов'), 'тегов')
+        return [objects[pk] for pk in tags]
 
     def validate(self, data):
         """Проверка на наличие  полей tags и ingredients"""
@@ -167,8 +246,8 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         return data
 
     def to_representation(self, instance):
-        """После создания или обновления рецепта
-        перенаправляет на RecipeReadSerializer"""
+        """После создания или обновления рецепта перенаправляет
+        на RecipeReadSerializer, теги и продукты уже загружены"""
         return RecipeReadSerializer(instance, context=self.context).data
 
     def extract_tags_and_ingredients(self, validated_data):
@@ -177,27 +256,72 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         tags = validated_data.pop('tags')
         return tags, ingredients
 
-    def update_tags_and_ingredients(self, recipe, tags, ingredients):
-        """Обновляет теги и ингредиенты рецепта"""
-        recipe.tags.set(tags)
-        recipe.recipe_ingredients.all().delete()
-        RecipeIngredient.objects.bulk_create(
-            RecipeIngredient(
-                recipe=recipe,
-                ingredient=ingredient['id'],
-                amount=ingredient['amount']
-            ) for ingredient in ingredients)
-
+    def update_tags(self, recipe, tags):
+        """Добавляет и удаляет только изменившиеся теги,
+        возвращает признак изменения"""
+        old_ids = {tag.id for tag in recipe.tags.all()}
+        new_ids = {tag.id for tag in tags}
+        if old_ids - new_ids:
+            recipe.tags.remove(*(old_ids - new_ids))
+        if new_ids - old_ids:
+            recipe.tags.add(*(new_ids - old_ids))
+        set_prefetched(recipe, 'tags', tags)
+        return old_ids != new_ids
+
+    def update_ingredients(self, recipe, ingredients):
+        """Добавляет, изменяет и удаляет только изменившиеся продукты,
+        переносит разницу в списки покупок и возвращает признак изменения"""
+        old_items = {
+            item.ingredient_id: item
+            for item in recipe.recipe_ingredients.all()}
+        old_amounts = {
+            pk: item.amount for pk, item in old_items.items()}
+        items, created, updated = [], [], []
+        for ingredient in ingredients:
+            item = old_items.pop(ingredient['ingredient'].id, None)
+            if item is None:
+                item = RecipeIngredient(recipe=recipe, **ingredient)
+                created.append(item)
+            elif item.amount != ingredient['amount']:
+                item.amount = ingredient['amount']
+                updated.append(item)
+            item.ingredient = ingredient['ingredient']
+            items.append(item)
+        if old_items:
+            RecipeIngredient.objects.filter(
+                pk__in=[item.pk for item in old_items.values()]).delete()
+        RecipeIngredient.objects.bulk_create(created)
+        if updated:
+            RecipeIngredient.objects.bulk_update(updated, ('amount',))
+        set_prefetched(recipe, 'recipe_ingredients', items)
+        changed = bool(old_items or created or updated)
+        if changed and old_amounts:
+            update_recipe_in_shopping_lists(recipe.id, old_amounts, {
+                item.ingredient_id: item.amount for item in items})
+        return changed
+
+    @transaction.atomic
     def create(self, validated_data):
         """Создание нового рецепта"""
         tags, ingredients = self.extract_tags_and_ingredients(validated_data)
         validated_data['author'] = self.context['request'].user
         recipe = super().create(validated_data)
-        self.update_tags_and_ingredients(recipe, tags, ingredients)
+        set_prefetched(recipe, 'tags', ())
+        set_prefetched(recipe, 'recipe_ingredients', ())
+        self.update_tags(recipe, tags)
+        self.update_ingredients(recipe, ingredients)
+        recipe.is_favorited = recipe.is_in_shopping_cart = False
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        """Обновление рецепта"""
+        """Обновление рецепта. Запись сохраняется, только если
+        изменились ее поля, теги или продукты"""
         tags, ingredients = self.extract_tags_and_ingredients(validated_data)
-        self.update_tags_and_ingredients(instance, tags, ingredients)
-        return super().update(instance, validated_data)
+        tags_changed = self.update_tags(instance, tags)
+        ingredients_changed = self.update_ingredients(instance, ingredients)
+        if (tags_changed or ingredients_changed or any(
+                getattr(instance, name) != value
+                for name, value in validated_data.items())):
+            return super().update(instance, validated_data)
+        return instance
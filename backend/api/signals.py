@@ -0,0 +1,82 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Tag,
+    User
+)
+from recipes.images import renditions_updated
+from recipes.signals import data_imported
+from .authentication import invalidate_token
+from .cache import bump_user_version, bump_version
+
+AUTHOR_FIELDS = {'username', 'first_name', 'last_name', 'avatar'}
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(data_imported)
+def invalidate_recipes_cache(**kwargs):
+    """Сбрасывает кэш рецептов при изменении данных рецептов"""
+    bump_version()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipes_cache_on_tags(action, **kwargs):
+    """Сбрасывает кэш рецептов при изменении тегов рецепта"""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_version()
+
+
+@receiver(post_save, sender=User)
+def invalidate_recipes_cache_on_author(instance, update_fields, **kwargs):
+    """Сбрасывает кэш рецептов при изменении данных автора"""
+    if update_fields and not AUTHOR_FIELDS & set(update_fields):
+        return
+    if instance.recipes.exists():
+        bump_version()
+
+
+@receiver(renditions_updated, sender=Recipe)
+@receiver(renditions_updated, sender=User)
+def invalidate_recipes_cache_on_renditions(sender, pk, **kwargs):
+    """Сбрасывает кэш рецептов, когда копии изображения рецепта
+    или аватара автора записаны в фоне запросом UPDATE без post_save"""
+    if sender is Recipe or Recipe.objects.filter(author_id=pk).exists():
+        bump_version()
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def invalidate_user_recipes(instance, **kwargs):
+    """Меняет ETag рецептов пользователя при изменении его
+    избранного или корзины"""
+    bump_user_version(instance.user_id)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(instance, **kwargs):
+    """Сбрасывает кэш аутентификации при выходе пользователя"""
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(instance, **kwargs):
+    """Сбрасывает кэш аутентификации при изменении пользователя"""
+    for key in Token.objects.filter(user=instance).values_list(
+            'key', flat=True):
+        invalidate_token(key)
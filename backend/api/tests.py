@@ -0,0 +1,472 @@
+import base64
+import re
+import shutil
+import tempfile
+from io import BytesIO
+from types import SimpleNamespace
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from api.filters import RecipeFilter
+from recipes.images import process_image
+from recipes.models import (
+    Favorite,
+    FeedEntry,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingListItem,
+    Subscription,
+    Tag,
+    User
+)
+from recipes.shopping_list import build_shopping_lists
+
+MEDIA_ROOT = tempfile.mkdtemp()
+RECIPES_COUNT = 10
+FULL_SCAN = re.compile(
+    r'Seq Scan on recipes_recipe\b|SCAN (TABLE )?recipes_recipe\b')
+
+
+def make_png():
+    """Содержимое небольшого изображения PNG"""
+    buffer = BytesIO()
+    Image.new('RGB', (2, 2)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def make_image():
+    """Изображение PNG в формате data URI для записи рецепта"""
+    return 'data:image/png;base64,' + base64.b64encode(make_png()).decode()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_PROCESSING_EXECUTOR='sync')
+class RecipesTestCase(TestCase):
+    """Теги, продукты и рецепты одного автора для тестов API"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag-{number}')
+            for number in range(3)]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Продукт {number}', measurement_unit='г')
+            for number in range(5)]
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com',
+            first_name='Имя', last_name='Фамилия', password='password')
+        for number in range(RECIPES_COUNT):
+            recipe = Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {number}', text='Текст',
+                cooking_time=number + 1, image='recipes/images/test.png')
+            recipe.tags.set(cls.tags[:number % 3 + 1])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=amount + 1)
+                for amount, ingredient in enumerate(
+                    cls.ingredients[:number % 5 + 1]))
+        cls.recipe = recipe
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+
+class RecipeQueriesTest(RecipesTestCase):
+    """Число SQL-запросов к рецептам не зависит от числа рецептов,
+    тегов и продуктов в ответе"""
+
+    def get_payload(self, tags, ingredients):
+        return {
+            'name': 'Новый рецепт',
+            'text': 'Текст',
+            'cooking_time': 10,
+            'image': make_image(),
+            'tags': [tag.id for tag in tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 5}
+                for ingredient in ingredients]}
+
+    def test_list(self):
+        with self.assertNumQueries(5):
+            response = self.client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 6)
+
+    def test_list_anonymous(self):
+        self.client.force_authenticate(None)
+        with self.assertNumQueries(5):
+            response = self.client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            self.client.get('/api/recipes/')
+
+    def test_retrieve(self):
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/recipes/{self.recipe.id}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_create(self):
+        with self.assertNumQueries(10):
+            response = self.client.post(
+                '/api/recipes/',
+                self.get_payload(self.tags, self.ingredients), format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(response.data['ingredients']), 5)
+
+    def test_update(self):
+        with self.assertNumQueries(16):
+            response = self.client.patch(
+                f'/api/recipes/{self.recipe.id}/',
+                self.get_payload(self.tags[1:], self.ingredients[2:]),
+                format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(len(response.data['tags']), 2)
+
+
+class RecipeCacheTest(RecipesTestCase):
+    """Сброс кэша и ETag рецептов"""
+
+    def test_renditions_update_resets_cache(self):
+        self.client.force_authenticate(None)
+        url = f'/api/recipes/{self.recipe.id}/'
+        name = default_storage.save('recipes/images/cached.png',
+                                    ContentFile(make_png()))
+        Recipe.objects.filter(pk=self.recipe.id).update(image=name)
+        response = self.client.get(url)
+        self.assertEqual(response.data['image_renditions'], {})
+        with self.captureOnCommitCallbacks(execute=True):
+            process_image('recipes.Recipe', self.recipe.id, 'image', name, {})
+        response = self.client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('small_webp', response.data['image_renditions'])
+
+
+class RecipeSearchTest(RecipesTestCase):
+    """Полнотекстовый поиск рецептов"""
+
+    def test_snippet_escapes_recipe_text(self):
+        Recipe.objects.filter(pk=self.recipe.id).update(
+            text='<script>alert(1)</script> суп c <i>укропом</i>')
+        response = self.client.get('/api/recipes/', {'search': 'укроп'})
+        self.assertEqual(
+            response.data['results'][0]['search_snippet'],
+            '&lt;script&gt;alert(1)&lt;/script&gt; суп c &lt;i&gt;'
+            '<b>укроп</b>ом&lt;/i&gt;')
+
+
+class RecipeFilterPlanTest(RecipesTestCase):
+    """Фильтры избранного и корзины начинают выборку co строк
+    пользователя и не читают таблицу рецептов полностью"""
+
+    def get_plan(self, data):
+        recipes = RecipeFilter(
+            data=data, queryset=Recipe.objects.all(),
+            request=SimpleNamespace(user=self.author)).qs
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return recipes.explain()
+
+    def test_filters_skip_full_scan(self):
+        for data in ({'is_favorited': 1}, {'is_in_shopping_cart': 1}):
+            with self.subTest(**data):
+                self.assertNotRegex(self.get_plan(data), FULL_SCAN)
+
+
+class BulkTest(RecipesTestCase):
+    """Пакетное добавление и удаление избранного, корзины и подписок"""
+
+    def setUp(self):
+        super().setUp()
+        self.reader = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            password='password')
+        self.client.force_authenticate(self.reader)
+        self.recipes = list(Recipe.objects.order_by('id')[:3])
+        self.ids = [recipe.id for recipe in self.recipes]
+
+    def get_counts(self, field):
+        return list(Recipe.objects.filter(id__in=self.ids).order_by(
+            'id').values_list(field, flat=True))
+
+    def test_favorite_bulk(self):
+        Favorite.objects.create(user=self.reader, recipe=self.recipes[0])
+        response = self.client.post(
+            '/api/recipes/favorite/bulk/',
+            {'ids': [*self.ids, 999, self.ids[1]]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [
+            {'id': self.ids[0], 'status': 'already_added'},
+            {'id': self.ids[1], 'status': 'created'},
+            {'id': self.ids[2], 'status': 'created'},
+            {'id': 999, 'status': 'not_found'}])
+        self.assertEqual(self.get_counts('favorites_count'), [1, 1, 1])
+        response = self.client.delete(
+            '/api/recipes/favorite/bulk/',
+            {'ids': [self.ids[0], self.recipe.id]}, format='json')
+        self.assertEqual(response.data, [
+            {'id': self.ids[0], 'status': 'deleted'},
+            {'id': self.recipe.id, 'status': 'not_added'}])
+        self.assertEqual(self.get_counts('favorites_count'), [0, 1, 1])
+
+    def test_shopping_cart_bulk(self):
+        response = self.client.post(
+            '/api/recipes/shopping_cart/bulk/', {'ids': self.ids},
+            format='json')
+        self.assertEqual(
+            {item['status'] for item in response.data}, {'created'})
+        self.assertEqual(self.get_counts('shopping_carts_count'), [1, 1, 1])
+        self.assertTrue(self.reader.shopping_list_items.exists())
+
+    def test_empty_ids(self):
+        response = self.client.post(
+            '/api/recipes/favorite/bulk/', {'ids': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_subscribe_bulk(self):
+        response = self.client.post(
+            '/api/users/subscribe/bulk/',
+            {'ids': [self.author.id, self.reader.id, 999]}, format='json')
+        self.assertEqual(response.data, [
+            {'id': self.author.id, 'status': 'created'},
+            {'id': self.reader.id, 'status': 'not_found'},
+            {'id': 999, 'status': 'not_found'}])
+        self.author.refresh_from_db()
+        self.reader.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 1)
+        self.assertEqual(self.reader.subscriptions_count, 1)
+        response = self.client.delete(
+            '/api/users/subscribe/bulk/', {'ids': [self.author.id]},
+            format='json')
+        self.assertEqual(
+            response.data, [{'id': self.author.id, 'status': 'deleted'}])
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 0)
+
+
+class ShoppingListTest(RecipesTestCase):
+    """Материализованный список покупок совпадает c построенным
+    заново по корзинам после изменений"""
+
+    def assertShoppingListsBuilt(self):
+        self.assertEqual(
+            {(item.user_id, item.ingredient_id): item.amount
+             for item in ShoppingListItem.objects.all()},
+            build_shopping_lists())
+
+    def test_list_follows_cart_and_recipes(self):
+        reader = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            password='password')
+        cart = APIClient()
+        cart.force_authenticate(reader)
+        recipes = list(Recipe.objects.order_by('id')[4:7])
+        for recipe in recipes:
+            cart.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        self.assertShoppingListsBuilt()
+        response = self.client.patch(
+            f'/api/recipes/{recipes[0].id}/', {
+                'ingredients': [
+                    {'id': self.ingredients[0].id, 'amount': 7},
+                    {'id': self.ingredients[4].id, 'amount': 2}],
+                'tags': [self.tags[0].id]},
+            format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertShoppingListsBuilt()
+        self.client.delete(f'/api/recipes/{recipes[1].id}/')
+        self.assertShoppingListsBuilt()
+        cart.delete(f'/api/recipes/{recipes[2].id}/shopping_cart/')
+        self.assertShoppingListsBuilt()
+        self.assertFalse(ShoppingListItem.objects.exclude(
+            user=reader).exists())
+        self.assertTrue(ShoppingListItem.objects.exists())
+
+
+class ConditionalRequestTest(RecipesTestCase):
+    """ETag и ответы 304 для рецептов, тегов и продуктов"""
+
+    def get(self, url, etag=None):
+        if etag is None:
+            return self.client.get(url)
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_recipes_not_modified(self):
+        response = self.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            cached = self.get('/api/recipes/', response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], response['ETag'])
+        self.assertIn('private', cached['Cache-Control'])
+
+    def test_recipes_etag_changes(self):
+        etag = self.get('/api/recipes/')['ETag']
+        self.assertNotEqual(
+            self.get('/api/recipes/?limit=3')['ETag'], etag)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/recipes/{self.recipe.id}/favorite/')
+        response = self.get('/api/recipes/', etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['results'][0]['is_favorited'])
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeIngredient.objects.filter(recipe=self.recipe)[0].save()
+        self.assertEqual(self.get('/api/recipes/', etag).status_code, 200)
+
+    def test_reference_data(self):
+        for url, model, data in (
+                ('/api/tags/', Tag, {'name': 'Новый', 'slug': 'new'}),
+                ('/api/ingredients/', Ingredient,
+                 {'name': 'Новый', 'measurement_unit': 'г'})):
+            with self.subTest(url=url):
+                response = self.get(url)
+                self.assertIn('public', response['Cache-Control'])
+                self.assertEqual(
+                    self.get(url, response['ETag']).status_code, 304)
+                with self.captureOnCommitCallbacks(execute=True):
+                    model.objects.create(**data)
+                self.assertEqual(
+                    self.get(url, response['ETag']).status_code, 200)
+
+
+class FeedTest(RecipesTestCase):
+    """Лента подписок: запись, дозаполнение и постраничный вывод"""
+
+    def setUp(self):
+        super().setUp()
+        self.reader = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            password='password')
+        self.client.force_authenticate(self.reader)
+
+    def get_feed(self, limit=4):
+        ids, url = [], f'/api/recipes/feed/?limit={limit}'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), limit)
+            ids.extend(recipe['id'] for recipe in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def get_expected(self):
+        return list(Recipe.objects.order_by(
+            '-pub_date', '-id').values_list('id', flat=True))
+
+    def test_subscription_backfills_and_pages(self):
+        self.assertEqual(self.get_feed(), [])
+        Subscription.objects.create(
+            subscriber=self.reader, subscribed_to=self.author)
+        self.assertEqual(
+            FeedEntry.objects.filter(user=self.reader).count(),
+            RECIPES_COUNT)
+        self.assertEqual(self.get_feed(), self.get_expected())
+        self.assertEqual(self.get_feed(limit=1), self.get_expected())
+
+    def test_new_recipe_fans_out(self):
+        Subscription.objects.create(
+            subscriber=self.reader, subscribed_to=self.author)
+        recipe = Recipe.objects.create(
+            author=self.author, name='Новый рецепт', text='Текст',
+            cooking_time=1, image='recipes/images/test.png')
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.reader, recipe=recipe).exists())
+        self.assertEqual(self.get_feed()[0], recipe.id)
+
+    def test_unsubscribe_trims(self):
+        subscription = Subscription.objects.create(
+            subscriber=self.reader, subscribed_to=self.author)
+        subscription.delete()
+        self.assertFalse(FeedEntry.objects.filter(user=self.reader).exists())
+        self.assertEqual(self.get_feed(), [])
+
+    @override_settings(FEED_FANOUT_LIMIT=0)
+    def test_popular_author_is_pulled(self):
+        Subscription.objects.create(
+            subscriber=self.reader, subscribed_to=self.author)
+        self.assertFalse(FeedEntry.objects.filter(user=self.reader).exists())
+        self.assertEqual(self.get_feed(), self.get_expected())
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/recipes/feed/?cursor=broken')
+        self.assertEqual(response.status_code, 404)
+
+
+class ByIngredientsTest(RecipesTestCase):
+    """Поиск рецептов по имеющимся продуктам"""
+
+    def search(self, ingredients, max_missing=None, limit=4):
+        params = {'ingredients': [
+            ingredient.id for ingredient in ingredients], 'limit': limit}
+        if max_missing is not None:
+            params['max_missing'] = max_missing
+        results, page = [], 1
+        while page:
+            response = self.client.get(
+                '/api/recipes/by-ingredients/', {**params, 'page': page})
+            self.assertEqual(response.status_code, 200)
+            results.extend(
+                (recipe['id'], recipe['matched_ingredients'],
+                 recipe['missing_ingredients'])
+                for recipe in response.data['results'])
+            page = page + 1 if response.data['next'] else None
+        return results
+
+    def get_expected(self, ingredients, max_missing=None):
+        found = []
+        for recipe in Recipe.objects.prefetch_related('ingredients'):
+            recipe_ingredients = set(recipe.ingredients.all())
+            matched = len(recipe_ingredients & set(ingredients))
+            missing = len(recipe_ingredients) - matched
+            if matched and (max_missing is None or missing <= max_missing):
+                found.append((recipe.id, matched, missing))
+        return sorted(found, key=lambda item: (
+            -item[1] / (item[1] + item[2]), item[2], -item[0]))
+
+    def test_ranking(self):
+        for ingredients, max_missing in (
+                (self.ingredients[:1], None),
+                (self.ingredients[:3], None),
+                (self.ingredients[1:3], 1),
+                (self.ingredients[:2], 0)):
+            with self.subTest(ingredients=ingredients,
+                              max_missing=max_missing):
+                expected = self.get_expected(ingredients, max_missing)
+                self.assertTrue(expected)
+                self.assertEqual(
+                    self.search(ingredients, max_missing), expected)
+
+    def test_recipe_change_updates_index(self):
+        missing = self.ingredients[4]
+        self.assertEqual(self.search([missing], 0), [])
+        recipe = Recipe.objects.get(
+            id=self.get_expected(self.ingredients[:1], 0)[0][0])
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=missing, amount=1)
+        self.assertIn((recipe.id, 1, 1), self.search([missing]))
+        self.assertEqual(
+            self.search([self.ingredients[0], missing], 0)[0],
+            (recipe.id, 2, 0))
+
+    def test_invalid_query(self):
+        for params in ({}, {'ingredients': 'abc'},
+                       {'ingredients': 1, 'max_missing': -1}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(
+                    '/api/recipes/by-ingredients/', params).status_code, 400)
@@ -1,7 +1,14 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
+from .views import (
+    CacheStatsView,
+    IngredientViewSet,
+    MetricsView,
+    RecipeViewSet,
+    TagViewSet,
+    UserViewSet
+)
 
 router = DefaultRouter()
 
@@ -12,4 +19,6 @@ router.register(r'recipes', RecipeViewSet, basename='recipes')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('cache-stats/', CacheStatsView.as_view(), name='cache-stats'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('auth/', include('djoser.urls.authtoken'))]
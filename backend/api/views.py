@@ -1,5 +1,16 @@
-from django.db.models import BooleanField, Exists, OuterRef, Sum, Value
-from django.http import FileResponse, Http404
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (
+    BooleanField,
+    Exists,
+    F,
+    OuterRef,
+    Prefetch,
+    Value
+)
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
 from django.utils import timezone as tz
@@ -8,26 +19,49 @@ from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
+from recipes.counters import RECIPE_COUNTERS, change_counter
+from recipes.feed import backfill_feed, get_feed_positions
 from recipes.models import (
     Favorite,
     Ingredient,
     Recipe,
-    RecipeIngredient,
     ShoppingCart,
+    SimilarRecipe,
     Subscription,
     Tag,
     User
 )
-from recipes.utils import get_shopping_cart_text
+from recipes.pantry import recipe_ingredient_index
+from recipes.search import INGREDIENTS_VERSION_KEY
+from recipes.shopping_list import add_recipes_to_shopping_list
+from recipes.short_links import encode_code, recipe_exists
+from recipes.tags import TAGS_VERSION_KEY
+from recipes.versions import get_version as get_data_version
+from recipes.utils import SHOPPING_CART_RENDERERS
+from .cache import (
+    AnonymousCacheMixin,
+    ConditionalMixin,
+    bump_user_version,
+    get_stats,
+    get_user_version,
+    get_version
+)
 from .filters import IngredientFilter, RecipeFilter
+from .metrics import SerializationMetricsMixin, registry
+from .negotiation import IgnoreClientContentNegotiation
+from .pagination import TimelinePagination
 from .permissions import IsAuthorOrReadOnly
 from .serializers import (
     AvatarSerializer,
+    BulkIdsSerializer,
     IngredientSerializer,
+    IngredientsQuerySerializer,
+    RecipeCoverageSerializer,
     RecipeWriteSerializer,
     RecipeReadSerializer,
     RecipeShortSerializer,
@@ -37,9 +71,28 @@ from .serializers import (
 )
 
 
-class UserViewSet(DjoserUserViewSet):
+def get_bulk_ids(request):
+    """Возвращает проверенный список id из тела пакетного запроса"""
+    serializer = BulkIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data['ids']
+
+
+def get_bulk_statuses(ids, found, changed, statuses):
+    """Формирует статус обработки для каждого id пакетного запроса"""
+    changed_status, unchanged_status = statuses
+    return [
+        {'id': pk, 'status': (
+            'not_found' if pk not in found
+            else changed_status if pk in changed
+            else unchanged_status)}
+        for pk in ids]
+
+
+class UserViewSet(SerializationMetricsMixin, DjoserUserViewSet):
     """ViewSet для пользователей и подписок"""
     serializer_class = UserSerializer
+    cursor_ordering = ('username',)
 
     def get_queryset(self):
         """Метод добавляет аннотацию is_subscribed"""
@@ -70,11 +123,36 @@ class UserViewSet(DjoserUserViewSet):
         serializer.save()
         return Response({'avatar': user.avatar.url}, status=status.HTTP_200_OK)
 
+    def get_recipes_limit(self):
+        """Возвращает значение параметра recipes_limit"""
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit is None:
+            return None
+        try:
+            recipes_limit = int(recipes_limit)
+        except ValueError:
+            recipes_limit = -1
+        if recipes_limit < 0:
+            raise ValidationError(
+                {'recipes_limit': 'Ожидается неотрицательное целое число'})
+        return recipes_limit
+
+    def get_authors_queryset(self):
+        """Авторы с последними рецептами,
+        ограниченными recipes_limit на каждого автора"""
+        recipes = Recipe.objects.all()
+        recipes_limit = self.get_recipes_limit()
+        if recipes_limit is not None:
+            recipes = recipes.filter(id__in=Recipe.objects.filter(
+                author=OuterRef('author')).values('id')[:recipes_limit])
+        return self.get_queryset().prefetch_related(
+            Prefetch('recipes', queryset=recipes))
+
     @action(methods=('GET',), detail=False,
             permission_classes=(IsAuthenticated,))
     def subscriptions(self, request):
         """Список подписок пользователя"""
-        subscriptions = self.get_queryset().prefetch_related('recipes').filter(
+        subscriptions = self.get_authors_queryset().filter(
             id__in=Subscription.objects.filter(subscriber=request.user).values(
                 'subscribed_to'))
         return self.get_paginated_response(
@@ -83,12 +161,42 @@ class UserViewSet(DjoserUserViewSet):
                 many=True,
                 context={'request': request}).data)
 
+    @action(methods=('POST', 'DELETE'), detail=False,
+            url_path='subscribe/bulk', permission_classes=(IsAuthenticated,))
+    @transaction.atomic
+    def subscribe_bulk(self, request):
+        """Добавляет или удаляет подписки на список авторов"""
+        user = request.user
+        ids = get_bulk_ids(request)
+        found = set(User.objects.filter(id__in=ids).exclude(
+            id=user.id).values_list('id', flat=True))
+        subscriptions = Subscription.objects.filter(
+            subscriber=user, subscribed_to__in=found)
+        subscribed = set(
+            subscriptions.values_list('subscribed_to_id', flat=True))
+        if request.method == 'DELETE':
+            changed = subscribed
+            subscriptions.delete()
+            statuses = ('deleted', 'not_subscribed')
+        else:
+            changed = found - subscribed
+            Subscription.objects.bulk_create(
+                (Subscription(subscriber=user, subscribed_to_id=pk)
+                 for pk in changed),
+                ignore_conflicts=True)
+            change_counter(
+                User, (user.id,), 'subscriptions_count', len(changed))
+            change_counter(User, changed, 'followers_count', 1)
+            backfill_feed(user.id, changed)
+            statuses = ('created', 'already_subscribed')
+        return Response(get_bulk_statuses(ids, found, changed, statuses))
+
     @action(methods=('POST', 'DELETE'),
             detail=True, permission_classes=(IsAuthenticated,))
     def subscribe(self, request, id):
         """Добавляет или удаляет подписку"""
         user = request.user
-        author = get_object_or_404(User, id=id)
+        author = get_object_or_404(self.get_authors_queryset(), id=id)
         if user == author:
             raise ValidationError(
                 {'detail': 'Нельзя подписаться или отписаться на самого себя'})
@@ -102,38 +210,88 @@ class UserViewSet(DjoserUserViewSet):
         if not created:
             raise ValidationError(
                 {'detail': f'Вы уже подписаны на {author.username}'})
+        author.is_subscribed = True
         return Response(UserWithRecipesSerializer(
             author, context={'request': request}).data,
             status=status.HTTP_201_CREATED)
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+class CacheStatsView(APIView):
+    """Счетчики кэша ответов API для мониторинга"""
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(get_stats())
+
+
+class MetricsView(APIView):
+    """Метрики запросов API и кэша в формате Prometheus"""
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        stats = get_stats()
+        return HttpResponse(
+            registry.export()
+            + '# TYPE api_cache_hits_total counter\n'
+            f'api_cache_hits_total {stats["hits"]}\n'
+            '# TYPE api_cache_misses_total counter\n'
+            f'api_cache_misses_total {stats["misses"]}\n',
+            content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class TagViewSet(
+        SerializationMetricsMixin, ConditionalMixin, ReadOnlyModelViewSet):
     """ViewSet тегов"""
     serializer_class = TagSerializer
     queryset = Tag.objects.all()
     pagination_class = None
+    cache_control = {
+        'public': True, 'max_age': settings.REFERENCE_DATA_MAX_AGE}
+    vary_headers = ()
+
+    def get_etag_parts(self, request):
+        return 'tags', get_data_version(TAGS_VERSION_KEY)
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(
+        SerializationMetricsMixin, ConditionalMixin, ReadOnlyModelViewSet):
     """ViewSet ингредиентов"""
     serializer_class = IngredientSerializer
     queryset = Ingredient.objects.all()
     pagination_class = None
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
+    cache_control = {
+        'public': True, 'max_age': settings.REFERENCE_DATA_MAX_AGE}
+    vary_headers = ()
 
+    def get_etag_parts(self, request):
+        return 'ingredients', get_data_version(INGREDIENTS_VERSION_KEY)
 
-class RecipeViewSet(ModelViewSet):
+
+class RecipeViewSet(SerializationMetricsMixin, ConditionalMixin,
+                    AnonymousCacheMixin, ModelViewSet):
     """ViewSet для управления рецептами"""
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     permission_classes = (IsAuthorOrReadOnly,)
     queryset = Recipe.objects.all()
+    cursor_ordering = ('-pub_date', '-id')
+
+    def get_etag_parts(self, request):
+        """Версия рецептов, а для пользователя еще и версия его
+        избранного и корзины, от которых зависят is_favorited
+        и is_in_shopping_cart"""
+        user = request.user
+        if not user.is_authenticated:
+            return 'recipes', get_version()
+        return 'recipes', get_version(), user.id, get_user_version(user.id)
 
     def get_queryset(self):
         """Добавляет аннотации is_favorited и is_in_shopping_cart"""
         queryset = (
             Recipe.objects
+            .defer('search_vector')
             .select_related('author')
             .prefetch_related('tags', 'recipe_ingredients__ingredient'))
         if self.request.user.is_authenticated:
@@ -156,33 +314,104 @@ class RecipeViewSet(ModelViewSet):
             return RecipeWriteSerializer
         return RecipeReadSerializer
 
+    def update(self, request, *args, **kwargs):
+        """Строит ответ сразу после записи, пока теги и продукты рецепта
+        есть в кэше prefetch_related: UpdateModelMixin.update
+        сбрасывает этот кэш и перечитывает их"""
+        serializer = self.get_serializer(
+            self.get_object(), data=request.data,
+            partial=kwargs.pop('partial', False))
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        return Response(serializer.data)
+
+    @action(methods=('GET',), detail=False,
+            permission_classes=(IsAuthenticated,))
+    def feed(self, request):
+        """Лента рецептов авторов, на которых подписан пользователь"""
+        paginator = TimelinePagination()
+        ids = paginator.paginate_positions(
+            partial(get_feed_positions, request.user), request)
+        recipes = self.get_queryset().in_bulk(ids)
+        return paginator.get_paginated_response(self.get_serializer(
+            [recipes[pk] for pk in ids if pk in recipes], many=True).data)
+
+    @action(methods=('GET',), detail=False, url_path='by-ingredients')
+    def by_ingredients(self, request):
+        """Рецепты по имеющимся продуктам, от наибольшей доли
+        имеющихся продуктов. База запрашивается только для страницы"""
+        query = IngredientsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        page = self.paginator.paginate_queryset(
+            recipe_ingredient_index.search(
+                query.validated_data['ingredients'],
+                query.validated_data.get('max_missing')),
+            request)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in page])
+        results = []
+        for recipe_id, matched, missing in page:
+            if recipe_id in recipes:
+                recipe = recipes[recipe_id]
+                recipe.matched_ingredients = matched
+                recipe.missing_ingredients = missing
+                results.append(recipe)
+        return self.get_paginated_response(RecipeCoverageSerializer(
+            results, many=True, context=self.get_serializer_context()).data)
+
+    @action(methods=('GET',), detail=True)
+    def similar(self, request, pk):
+        """Рецепты c общими продуктами и тегами, от самых похожих"""
+        if not pk.isdigit() or not recipe_exists(int(pk)):
+            raise Http404(f'Рецепта с pk={pk} не существует')
+        ids = list(SimilarRecipe.objects.filter(recipe_id=pk).order_by(
+            '-score', 'similar').values_list('similar', flat=True))
+        recipes = Recipe.objects.in_bulk(ids)
+        return Response(RecipeShortSerializer(
+            [recipes[id] for id in ids if id in recipes], many=True,
+            context={'request': request}).data)
+
     @action(methods=('GET',), detail=True, url_path='get-link')
     def get_short_link(self, request, pk):
         """Возвращает короткую ссылку на рецепт"""
-        if not Recipe.objects.filter(pk=pk).exists():
+        if not pk.isdigit() or not recipe_exists(int(pk)):
             raise Http404(f'Рецепта с pk={pk} не существует')
         return Response({'short-link': request.build_absolute_uri(
-            reverse('recipes:redirect-to-recipe', args=[pk]))})
+            reverse('recipes:redirect-to-recipe',
+                    args=[encode_code(int(pk))]))})
 
     @action(methods=('GET',), detail=False,
-            permission_classes=(IsAuthenticated,))
+            permission_classes=(IsAuthenticated,),
+            content_negotiation_class=IgnoreClientContentNegotiation)
     def download_shopping_cart(self, request):
-        """Для скачивания списка покупок"""
+        """Для скачивания списка покупок в формате из параметра format"""
+        file_format = request.query_params.get('format', 'txt')
+        if file_format not in SHOPPING_CART_RENDERERS:
+            raise ValidationError({'format': (
+                'Поддерживаемые форматы: '
+                f'{", ".join(SHOPPING_CART_RENDERERS)}')})
+        renderer, content_type = SHOPPING_CART_RENDERERS[file_format]
         user_recipes_in_cart = (
             self.request.user.cart_items.values_list('recipe', flat=True))
-        product_list = list(
-            RecipeIngredient.objects
-            .filter(recipe__in=user_recipes_in_cart)
+        products = (
+            request.user.shopping_list_items
             .values('ingredient__name', 'ingredient__measurement_unit')
-            .annotate(total_amount=Sum('amount'))
+            .annotate(total_amount=F('amount'))
             .order_by('ingredient__name')
         )
-        recipes = Recipe.objects.filter(id__in=user_recipes_in_cart)
+        recipes = (
+            Recipe.objects
+            .filter(id__in=user_recipes_in_cart)
+            .select_related('author')
+            .only('id', 'name', 'author__username')
+        )
         date = tz.now().strftime('%d-%m-%Y')
-        return FileResponse(
-            get_shopping_cart_text(product_list, recipes),
-            content_type='text/plain',
-            filename=f'shopping-list-{date}.txt')
+        response = StreamingHttpResponse(
+            renderer(products.iterator(), recipes.iterator()),
+            content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping-list-{date}.{file_format}"')
+        return response
 
     def handle_recipe(self, request, model):
         """Обработчик POST/DELETE-запросов для управления
@@ -201,6 +430,44 @@ class RecipeViewSet(ModelViewSet):
             RecipeShortSerializer(recipe).data,
             status=status.HTTP_201_CREATED)
 
+    @transaction.atomic
+    def handle_recipes_bulk(self, request, model):
+        """Пакетное добавление или удаление связей пользователя
+        со списком рецептов"""
+        ids = get_bulk_ids(request)
+        found = set(
+            Recipe.objects.filter(id__in=ids).values_list('id', flat=True))
+        relations = model.objects.filter(user=request.user, recipe__in=found)
+        linked = set(relations.values_list('recipe_id', flat=True))
+        if request.method == 'DELETE':
+            changed = linked
+            relations.delete()
+            statuses = ('deleted', 'not_added')
+        else:
+            changed = found - linked
+            model.objects.bulk_create(
+                (model(user=request.user, recipe_id=pk) for pk in changed),
+                ignore_conflicts=True)
+            change_counter(Recipe, changed, RECIPE_COUNTERS[model], 1)
+            bump_user_version(request.user.id)
+            if model is ShoppingCart:
+                add_recipes_to_shopping_list(request.user.id, changed)
+            statuses = ('created', 'already_added')
+        return Response(get_bulk_statuses(ids, found, changed, statuses))
+
+    @action(methods=('POST', 'DELETE'), detail=False,
+            url_path='shopping_cart/bulk',
+            permission_classes=(IsAuthenticated,))
+    def shopping_cart_bulk(self, request):
+        """Пакетное управление списком покупок"""
+        return self.handle_recipes_bulk(request, ShoppingCart)
+
+    @action(methods=('POST', 'DELETE'), detail=False,
+            url_path='favorite/bulk', permission_classes=(IsAuthenticated,))
+    def favorite_bulk(self, request):
+        """Пакетное управление списком избранного"""
+        return self.handle_recipes_bulk(request, Favorite)
+
     @action(methods=('POST', 'DELETE'), detail=True,
             permission_classes=(IsAuthenticated,))
     def shopping_cart(self, request, pk):
@@ -39,6 +39,12 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+API_METRICS_ENABLED = os.getenv('API_METRICS_ENABLED', 'False') == 'True'
+API_QUERY_BUDGET = int(os.getenv('API_QUERY_BUDGET', 20))
+API_LATENCY_BUDGET = float(os.getenv('API_LATENCY_BUDGET', 0.5))
+if API_METRICS_ENABLED:
+    MIDDLEWARE.insert(0, 'api.metrics.QueryMetricsMiddleware')
+
 ROOT_URLCONF = 'foodgram_backend.urls'
 
 TEMPLATES = [
@@ -110,11 +116,54 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 DEFAULT_AVATAR_URL = '/static/admin/img/default-avatar.png'
 
+SHARED_CACHE = os.getenv('DB_TYPE', 'postgres') == 'postgres'
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', (
+            'django.core.cache.backends.db.DatabaseCache' if SHARED_CACHE
+            else 'django.core.cache.backends.locmem.LocMemCache')),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION', 'django_cache' if SHARED_CACHE else 'foodgram'),
+    }
+}
+API_CACHE_ALIAS = 'default'
+API_CACHE_TIMEOUT = int(os.getenv('API_CACHE_TIMEOUT', 300))
+
+INGREDIENT_SEARCH_LIMIT = 50
+
+REFERENCE_DATA_MAX_AGE = int(os.getenv('REFERENCE_DATA_MAX_AGE', 300))
+
+RECIPE_SEARCH_CONFIG = os.getenv('RECIPE_SEARCH_CONFIG', 'russian')
+
+COOKING_TIME_QUANTILES = (
+    os.getenv('COOKING_TIME_QUANTILES', 'False') == 'True')
+
+TOKEN_CACHE_TIMEOUT = int(os.getenv('TOKEN_CACHE_TIMEOUT', 60))
+
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 10000))
+FEED_BACKFILL_SIZE = int(os.getenv('FEED_BACKFILL_SIZE', 100))
+
+SIMILAR_RECIPES_COUNT = int(os.getenv('SIMILAR_RECIPES_COUNT', 20))
+SIMILAR_RECIPES_METRIC = os.getenv('SIMILAR_RECIPES_METRIC', 'cosine')
+SIMILAR_RECIPES_MAX_FEATURE_RECIPES = int(
+    os.getenv('SIMILAR_RECIPES_MAX_FEATURE_RECIPES', 1000))
+
+SHORT_LINK_OBFUSCATE = os.getenv('SHORT_LINK_OBFUSCATE', 'False') == 'True'
+SHORT_LINK_CACHE_TIMEOUT = int(os.getenv('SHORT_LINK_CACHE_TIMEOUT', 86400))
+SHORT_LINK_MISSING_CACHE_TIMEOUT = int(
+    os.getenv('SHORT_LINK_MISSING_CACHE_TIMEOUT', 60))
+SHORT_LINK_FLUSH_SIZE = int(os.getenv('SHORT_LINK_FLUSH_SIZE', 100))
+SHORT_LINK_FLUSH_INTERVAL = int(os.getenv('SHORT_LINK_FLUSH_INTERVAL', 30))
+
+IMAGE_RENDITIONS = {'small': 320, 'medium': 960}
+IMAGE_PROCESSING_EXECUTOR = os.getenv('IMAGE_PROCESSING_EXECUTOR', 'thread')
+IMAGE_PROCESSING_WORKERS = int(os.getenv('IMAGE_PROCESSING_WORKERS', 2))
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly', ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication', ],
+        'api.authentication.CachedTokenAuthentication', ],
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.LimitPageNumberPagination',
     'PAGE_SIZE': 6,
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
@@ -8,6 +8,7 @@ from django.contrib.admin import (
 )
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import Group
+from django.db.models import Count, Prefetch
 from django.utils.safestring import mark_safe
 
 from .admin_filters import (
@@ -26,6 +27,7 @@ from .models import (
     Tag,
     User
 )
+from .shopping_list import get_recipe_amounts, update_recipe_in_shopping_lists
 
 site.site_header = 'Администрирование Foodgram'
 site.site_title = 'Foodgram Администрирование'
@@ -39,9 +41,13 @@ class RecipeCountMixin:
     """Миксин для показа числа рецептов"""
     list_display = ('get_recipe_count',)
 
-    @display(description='Число рецептов')
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            recipe_count=Count('recipes', distinct=True))
+
+    @display(description='Число рецептов', ordering='recipe_count')
     def get_recipe_count(self, obj):
-        return obj.recipes.count()
+        return obj.recipe_count
 
 
 @register(User)
@@ -87,15 +93,19 @@ class ExtendedUserAdmin(UserAdmin, RecipeCountMixin):
         """Метод возвращает увеличенную версию аватара"""
         return self.get_avatar(user, '200px')
 
-    @display(description='Подписки')
+    @display(description='Подписки', ordering='subscriptions_count')
     def subscription_count(self, user):
         """Метод возвращает количество подписок пользователя"""
-        return user.subscribers.count()
+        return user.subscriptions_count
 
-    @display(description='Подписчики')
+    @display(description='Подписчики', ordering='followers_count')
     def follower_count(self, user):
         """Метод возвращает количество подписчиков пользователя"""
-        return user.authors.count()
+        return user.followers_count
+
+    @display(description='Число рецептов', ordering='recipes_count')
+    def get_recipe_count(self, user):
+        return user.recipes_count
 
 
 @register(Subscription)
@@ -113,14 +123,14 @@ class RecipeIngredientInline(TabularInline):
 
 
 @register(Tag)
-class TagAdmin(ModelAdmin, RecipeCountMixin):
+class TagAdmin(RecipeCountMixin, ModelAdmin):
     """Класс для управления моделью тегов в админ-панели"""
     list_display = ('name', 'slug', *RecipeCountMixin.list_display)
     search_fields = ('name', 'slug')
 
 
 @register(Ingredient)
-class IngredientAdmin(ModelAdmin, RecipeCountMixin):
+class IngredientAdmin(RecipeCountMixin, ModelAdmin):
     """Класс для управления моделью ингредиентов в админ-панели"""
     list_display = ('name', 'measurement_unit', *RecipeCountMixin.list_display)
     search_fields = ('name', 'measurement_unit')
@@ -132,23 +142,37 @@ class RecipeAdmin(ModelAdmin):
     """Класс для управления моделью рецептов в админ-панели"""
     list_display = (
         'id', 'name', 'cooking_time', 'author', 'get_tags',
-        'get_favorite_count', 'get_ingredients', 'get_image'
+        'get_favorite_count', 'short_link_clicks', 'get_ingredients',
+        'get_image'
     )
     search_fields = ('name', 'author__username', 'tags__name')
     list_filter = ('tags', 'author', CookingTimeFilter)
     inlines = (RecipeIngredientInline,)
     filter_horizontal = ('tags',)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'author'
+        ).prefetch_related('tags', Prefetch(
+            'recipe_ingredients',
+            queryset=RecipeIngredient.objects.select_related('ingredient')))
+
+    def save_related(self, request, form, formsets, change):
+        """Переносит изменения состава рецепта в списки покупок"""
+        old_amounts = get_recipe_amounts((form.instance.id,))
+        super().save_related(request, form, formsets, change)
+        update_recipe_in_shopping_lists(form.instance.id, old_amounts)
+
     @display(description='Теги')
     @mark_safe
     def get_tags(self, recipe):
         """Метод отображает теги рецепта"""
         return '<br>'.join(tag.name for tag in recipe.tags.all())
 
-    @display(description='В избранном')
+    @display(description='В избранном', ordering='favorites_count')
     def get_favorite_count(self, recipe):
         """Метод возвращает число добавлений рецепта в избранное"""
-        return recipe.favorites.count()
+        return recipe.favorites_count
 
     @display(description='Продукты')
     @mark_safe
@@ -1,4 +1,7 @@
+from django.conf import settings
 from django.contrib.admin import SimpleListFilter
+from django.core.cache import cache
+from django.db.models import Count, Exists, OuterRef
 
 from .models import Recipe
 
@@ -13,12 +16,23 @@ class BaseFilter(SimpleListFilter):
     def lookups(self, request, model_admin):
         return self.LOOKUPS
 
+    def get_exists(self, model):
+        """Подзапрос EXISTS по обратной связи relation_field:
+        без JOIN и DISTINCT во внешнем запросе"""
+        relation = model._meta.get_field(self.relation_field)
+        if relation.many_to_many:
+            related = relation.through.objects.filter(**{
+                relation.field.m2m_reverse_field_name(): OuterRef('pk')})
+        else:
+            related = relation.related_model.objects.filter(
+                **{relation.field.name: OuterRef('pk')})
+        return Exists(related)
+
     def queryset(self, request, queryset):
         if self.value() == 'yes':
-            return queryset.filter(
-                **{f'{self.relation_field}__isnull': False}).distinct()
+            return queryset.filter(self.get_exists(queryset.model))
         if self.value() == 'no':
-            return queryset.filter(**{f'{self.relation_field}__isnull': True})
+            return queryset.filter(~self.get_exists(queryset.model))
         return queryset
 
 
@@ -47,30 +61,71 @@ class CookingTimeFilter(SimpleListFilter):
     """Фильтр по времени готовки"""
     title = 'Время готовки'
     parameter_name = 'cooking_time'
+    cache_key = 'admin:cooking-time-ranges'
+    cache_timeout = 60
 
     def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
         self.ranges = None
+        self.counts = None
         self.fast = None
         self.medium = None
+        self.use_quantiles = settings.COOKING_TIME_QUANTILES
+        super().__init__(*args, **kwargs)
+
+    def get_bounds(self, histogram):
+        """Верхние границы быстрых и средних рецептов: трети
+        максимального времени или терцили распределения"""
+        max_time = histogram[-1][0]
+        bounds = (max_time // 3, 2 * max_time // 3)
+        if not self.use_quantiles:
+            return bounds
+        total = sum(count for _, count in histogram)
+        quantiles, seen = [], 0
+        for time, count in histogram:
+            seen += count
+            if len(quantiles) < 2 and seen * 3 >= total * (len(quantiles) + 1):
+                quantiles.append(time)
+        if len(quantiles) == 2 and quantiles[0] < quantiles[1] < max_time:
+            return tuple(quantiles)
+        return bounds
+
+    def get_ranges(self):
+        """Диапазоны и число рецептов в них по одному запросу
+        c группировкой по времени готовки"""
+        histogram = list(
+            Recipe.objects.order_by('cooking_time').values_list(
+                'cooking_time').annotate(count=Count('pk')))
+        if len(histogram) < 3:
+            return None, None
+        fast, medium = self.get_bounds(histogram)
+        ranges = {
+            'fast': (0, fast),
+            'medium': (fast + 1, medium),
+            'long': (medium + 1, histogram[-1][0])
+        }
+        counts = {
+            key: sum(count for time, count in histogram if low <= time <= high)
+            for key, (low, high) in ranges.items()}
+        return ranges, counts
 
     def set_ranges(self):
         """Определяет диапазоны времени готовки и сохраняет их в экземпляре"""
-        times = Recipe.objects.values_list('cooking_time', flat=True)
-        if len(set(times)) < 3:
+        if self.ranges is not None:
             return
-        max_time = max(times)
-        self.fast = max_time // 3
-        self.medium = (2 * max_time) // 3
-        self.ranges = {
-            'fast': (0, self.fast),
-            'medium': (self.fast + 1, self.medium),
-            'long': (self.medium + 1, max_time)
-        }
+        key = f'{self.cache_key}:{int(self.use_quantiles)}'
+        cached = cache.get(key)
+        if cached is None:
+            cached = self.get_ranges()
+            cache.set(key, cached, self.cache_timeout)
+        self.ranges, self.counts = cached
+        if self.ranges:
+            self.fast = self.ranges['fast'][1]
+            self.medium = self.ranges['medium'][1]
 
     def filter_by_range(self, key, recipes=None):
         """Фильтрация рецептов по диапазону времени готовки"""
-        recipes = recipes or Recipe.objects
+        if recipes is None:
+            recipes = Recipe.objects.all()
         return recipes.filter(cooking_time__range=self.ranges[key])
 
     def lookups(self, request, model_admin):
@@ -78,25 +133,14 @@ class CookingTimeFilter(SimpleListFilter):
         if not self.ranges:
             return []
         return (
-            (
-                'fast',
-                f'Быстрее {self.fast} мин '
-                f'({self.filter_by_range("fast").count()})'
-            ),
-            (
-                'medium',
-                f'Быстрее {self.medium} мин '
-                f'({self.filter_by_range("medium").count()})'
-            ),
-            (
-                'long',
-                f'Долго '
-                f'({self.filter_by_range("long").count()})'
-            ),
+            ('fast', f'Быстрее {self.fast} мин ({self.counts["fast"]})'),
+            ('medium',
+             f'Быстрее {self.medium} мин ({self.counts["medium"]})'),
+            ('long', f'Долго ({self.counts["long"]})'),
         )
 
     def queryset(self, request, recipes):
         self.set_ranges()
-        if not self.value():
+        if not self.ranges or self.value() not in self.ranges:
             return recipes
         return self.filter_by_range(self.value(), recipes)
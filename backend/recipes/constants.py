@@ -1,3 +1,4 @@
 MIN_COOKING_TIME = 1
 MIN_INGREDIENT_AMOUNT = 1
 MAX_LENGTH_RECIPE_NAME = 256
+MAX_BULK_ITEMS = 100
@@ -0,0 +1,46 @@
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Favorite, Recipe, ShoppingCart, Subscription, User
+
+RECIPE_COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'shopping_carts_count',
+}
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'shopping_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'subscriptions_count', Subscription, 'subscriber'),
+    (User, 'followers_count', Subscription, 'subscribed_to'),
+)
+
+
+def count_subquery(related_model, related_field):
+    """Подзапрос числа связанных записей для каждой строки"""
+    return Coalesce(Subquery(
+        related_model.objects
+        .filter(**{related_field: OuterRef('pk')})
+        .order_by()
+        .values(related_field)
+        .annotate(count=Count('pk'))
+        .values('count')), 0)
+
+
+def change_counter(model, pks, field, delta):
+    """Атомарно изменяет счетчик записей с указанными pk"""
+    model.objects.filter(pk__in=pks).update(
+        **{field: Greatest(F(field) + delta, 0)})
+
+
+def get_drift(model, field, related_model, related_field):
+    """Число записей, у которых счетчик расходится с реальным"""
+    return model.objects.annotate(
+        actual=count_subquery(related_model, related_field)
+    ).filter(~Q(**{field: F('actual')})).count()
+
+
+def recount(model, field, related_model, related_field):
+    """Пересчитывает счетчик у всех записей одним запросом"""
+    return model.objects.update(
+        **{field: count_subquery(related_model, related_field)})
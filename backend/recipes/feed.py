@@ -0,0 +1,93 @@
+from collections import defaultdict
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db.models import OuterRef, Q
+
+from .models import FeedEntry, Recipe, Subscription
+
+BATCH_SIZE = 1000
+
+
+def create_entries(entries, model=FeedEntry):
+    model.objects.bulk_create(
+        entries, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def fan_out_recipe(recipe):
+    """Записывает новый рецепт в ленты подписчиков автора.
+    Рецепты авторов c числом подписчиков больше FEED_FANOUT_LIMIT
+    не записываются, а читаются при запросе ленты"""
+    subscribers = Subscription.objects.filter(
+        subscribed_to_id=recipe.author_id,
+        subscribed_to__followers_count__lte=settings.FEED_FANOUT_LIMIT
+    ).values_list('subscriber_id', flat=True)
+    create_entries(
+        FeedEntry(user_id=user_id, recipe_id=recipe.id,
+                  author_id=recipe.author_id, pub_date=recipe.pub_date)
+        for user_id in subscribers.iterator())
+
+
+def backfill_feed(user_id, author_ids, apps=global_apps):
+    """Добавляет в ленту последние FEED_BACKFILL_SIZE рецептов
+    каждого из авторов, на которых подписался пользователь.
+    apps позволяет вызвать функцию из миграции"""
+    recipe_model = apps.get_model('recipes', 'Recipe')
+    entry_model = apps.get_model('recipes', 'FeedEntry')
+    recipes = recipe_model.objects.filter(
+        author_id__in=author_ids,
+        author__followers_count__lte=settings.FEED_FANOUT_LIMIT,
+        id__in=recipe_model.objects.filter(
+            author=OuterRef('author')
+        ).values('id')[:settings.FEED_BACKFILL_SIZE])
+    create_entries((
+        entry_model(user_id=user_id, recipe_id=recipe_id,
+                    author_id=author_id, pub_date=pub_date)
+        for recipe_id, author_id, pub_date in recipes.values_list(
+            'id', 'author_id', 'pub_date')), entry_model)
+
+
+def trim_feed(user_id, author_ids):
+    """Убирает из ленты рецепты авторов, от которых отписался пользователь"""
+    FeedEntry.objects.filter(
+        user_id=user_id, author_id__in=author_ids).delete()
+
+
+def rebuild_feeds(user_ids=None, apps=global_apps):
+    """Заново заполняет ленты пользователей по их подпискам"""
+    entries = apps.get_model('recipes', 'FeedEntry').objects.all()
+    subscriptions = apps.get_model('recipes', 'Subscription').objects.all()
+    if user_ids is not None:
+        entries = entries.filter(user_id__in=user_ids)
+        subscriptions = subscriptions.filter(subscriber_id__in=user_ids)
+    entries.delete()
+    authors = defaultdict(list)
+    for user_id, author_id in subscriptions.values_list(
+            'subscriber_id', 'subscribed_to_id'):
+        authors[user_id].append(author_id)
+    for user_id, author_ids in authors.items():
+        backfill_feed(user_id, author_ids, apps)
+    return len(authors)
+
+
+def get_feed_positions(user, limit, before=None):
+    """Позиции (pub_date, id) не более limit рецептов ленты после before:
+    записи ленты пользователя, слитые c рецептами авторов, которые
+    читаются при запросе"""
+    entries = FeedEntry.objects.filter(user=user)
+    pulled = Recipe.objects.filter(author__in=Subscription.objects.filter(
+        subscriber=user,
+        subscribed_to__followers_count__gt=settings.FEED_FANOUT_LIMIT
+    ).values('subscribed_to'))
+    if before is not None:
+        pub_date, pk = before
+        entries = entries.filter(
+            Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, recipe__lt=pk))
+        pulled = pulled.filter(
+            Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=pk))
+    positions = {
+        *entries.order_by('-pub_date', '-recipe').values_list(
+            'pub_date', 'recipe')[:limit],
+        *pulled.order_by('-pub_date', '-id').values_list(
+            'pub_date', 'id')[:limit]}
+    return sorted(positions, reverse=True)[:limit]
@@ -0,0 +1,116 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.dispatch import Signal
+from PIL import Image, ImageOps
+
+FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+SOURCE_KEY = 'source'
+
+logger = logging.getLogger(__name__)
+executor = None
+renditions_updated = Signal()
+
+
+def get_executor():
+    """Возвращает пул потоков для обработки изображений"""
+    global executor
+    if executor is None:
+        executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_PROCESSING_WORKERS,
+            thread_name_prefix='images')
+    return executor
+
+
+def get_rendition_name(name, size_name, extension):
+    """Путь копии изображения рядом с оригиналом"""
+    directory, file_name = os.path.split(name)
+    stem = os.path.splitext(file_name)[0]
+    return os.path.join(
+        directory, 'renditions', f'{stem}_{size_name}.{extension}')
+
+
+def delete_renditions(storage, renditions):
+    """Удаляет файлы копий изображения"""
+    for key, name in renditions.items():
+        if key != SOURCE_KEY and storage.exists(name):
+            storage.delete(name)
+
+
+def make_renditions(storage, name):
+    """Создает уменьшенные копии изображения во всех форматах"""
+    with storage.open(name) as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    renditions = {SOURCE_KEY: name}
+    for size_name, size in settings.IMAGE_RENDITIONS.items():
+        resized = image.copy()
+        resized.thumbnail((size, size))
+        for extension, image_format in FORMATS.items():
+            if image_format == 'JPEG':
+                resized = resized.convert('RGB')
+            buffer = BytesIO()
+            resized.save(buffer, image_format, quality=85)
+            rendition = get_rendition_name(name, size_name, extension)
+            if storage.exists(rendition):
+                storage.delete(rendition)
+            renditions[f'{size_name}_{extension}'] = storage.save(
+                rendition, ContentFile(buffer.getvalue()))
+    return renditions
+
+
+def process_image(model_label, pk, field_name, name, old_renditions):
+    """Строит копии изображения и сохраняет их пути в записи,
+    если изображение за это время не было заменено. Запись меняется
+    запросом UPDATE без post_save, поэтому об обновлении сообщает
+    сигнал renditions_updated"""
+    model = apps.get_model(model_label)
+    storage = model._meta.get_field(field_name).storage
+    try:
+        delete_renditions(storage, old_renditions)
+        renditions = make_renditions(storage, name)
+        updated = model.objects.filter(
+            pk=pk, **{field_name: name}
+        ).update(**{f'{field_name}_renditions': renditions})
+        if not updated:
+            delete_renditions(storage, renditions)
+            return
+        renditions_updated.send(
+            sender=model, pk=pk, field_name=field_name,
+            renditions=renditions)
+    except Exception:
+        logger.exception('Ошибка обработки изображения %s', name)
+    finally:
+        if settings.IMAGE_PROCESSING_EXECUTOR != 'sync':
+            connections.close_all()
+
+
+def schedule_image_processing(instance, field_name):
+    """Ставит обработку изображения в очередь после фиксации транзакции,
+    если копии еще не построены для текущего файла"""
+    name = getattr(instance, field_name).name
+    renditions = getattr(instance, f'{field_name}_renditions')
+    if renditions.get(SOURCE_KEY) == name:
+        return
+    if not name:
+        if renditions:
+            delete_renditions(
+                instance._meta.get_field(field_name).storage, renditions)
+            type(instance).objects.filter(pk=instance.pk).update(
+                **{f'{field_name}_renditions': {}})
+        return
+    arguments = (
+        instance._meta.label, instance.pk, field_name, name, renditions)
+    if settings.IMAGE_PROCESSING_EXECUTOR == 'sync':
+        transaction.on_commit(lambda: process_image(*arguments))
+    else:
+        transaction.on_commit(
+            lambda: get_executor().submit(process_image, *arguments))
@@ -1,28 +1,174 @@
+import csv
 import json
 import os
+from itertools import islice
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.signals import data_imported
 
 DATA_PATH = os.path.join(settings.BASE_DIR, 'data')
+CHUNK_SIZE = 64 * 1024
+FORMATS = ('json', 'csv', 'ndjson')
+
+
+def read_json(file):
+    """Построчно читает элементы JSON-массива, не загружая файл целиком"""
+    decoder = json.JSONDecoder()
+    buffer, position, started = '', 0, False
+    for chunk in iter(lambda: file.read(CHUNK_SIZE), ''):
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and (
+                    buffer[position].isspace() or buffer[position] == ','):
+                position += 1
+            if position == len(buffer):
+                break
+            if not started:
+                if buffer[position] != '[':
+                    raise ValueError('Ожидается JSON-массив')
+                started = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                row, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            yield row
+            position = end
+    raise ValueError('Неожиданный конец JSON-массива')
+
+
+def read_ndjson(file):
+    """Читает по одному JSON-объекту из каждой непустой строки"""
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_csv(file):
+    """Читает строки CSV c заголовком"""
+    yield from csv.DictReader(file)
+
+
+READERS = {'json': read_json, 'csv': read_csv, 'ndjson': read_ndjson}
 
 
 class BaseImportCommand(BaseCommand):
-    """Базовый класс для импорта данных из JSON"""
+    """Базовый класс для потокового импорта данных c обновлением записей.
+    Записи сопоставляются по lookup_fields, поля update_fields обновляются.
+    После каждой пачки сохраняется контрольная точка для --resume"""
+    file_name = ''
+    model = None
+    lookup_fields = ()
+    update_fields = ()
 
     def add_arguments(self, parser):
-        parser.add_argument('--path', type=str, default=DATA_PATH)
+        parser.add_argument(
+            '--path', type=str, default=DATA_PATH,
+            help='Файл или каталог c файлом по умолчанию')
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='Формат файла, по умолчанию по расширению')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Продолжить c последней контрольной точки')
 
-    def import_data(self, file_name, model, fields):
-        file_path = os.path.join(DATA_PATH, file_name)
+    def get_file_path(self, path):
+        if os.path.isdir(path):
+            return os.path.join(path, self.file_name)
+        return path
+
+    def get_format(self, file_path, file_format):
+        file_format = file_format or os.path.splitext(
+            file_path)[1].lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {file_format}')
+        return file_format
+
+    def get_checkpoint(self, file_path):
+        with open(f'{file_path}.checkpoint', encoding='utf-8') as file:
+            return int(file.read())
+
+    def save_checkpoint(self, file_path, processed):
+        with open(f'{file_path}.checkpoint', 'w', encoding='utf-8') as file:
+            file.write(str(processed))
+
+    def get_key(self, row):
+        return tuple(row[field] for field in self.lookup_fields)
+
+    def import_batch(self, rows):
+        """Добавляет новые и обновляет измененные записи пачки,
+        возвращает число добавленных, обновленных и пропущенных"""
+        fields = (*self.lookup_fields, *self.update_fields)
+        rows = {
+            self.get_key(row): {field: row[field] for field in fields}
+            for row in rows}
+        lookup = {
+            f'{field}__in': {key[index] for key in rows}
+            for index, field in enumerate(self.lookup_fields)}
+        existing = {
+            self.get_key(vars(instance)): instance
+            for instance in self.model.objects.filter(**lookup)}
+        created, updated = [], []
+        for key, row in rows.items():
+            instance = existing.get(key)
+            if instance is None:
+                created.append(self.model(**row))
+            elif any(getattr(instance, field) != row[field]
+                     for field in self.update_fields):
+                for field in self.update_fields:
+                    setattr(instance, field, row[field])
+                updated.append(instance)
+        self.model.objects.bulk_create(created)
+        if updated:
+            self.model.objects.bulk_update(updated, self.update_fields)
+        return (len(created), len(updated),
+                len(rows) - len(created) - len(updated))
+
+    def import_data(self, path, file_format, batch_size, resume):
+        file_path = self.get_file_path(path)
+        processed = 0
+        if resume and os.path.exists(f'{file_path}.checkpoint'):
+            processed = self.get_checkpoint(file_path)
+            self.stdout.write(f'Продолжение c записи {processed}')
+        reader = READERS[self.get_format(file_path, file_format)]
+        totals = [0, 0, 0]
         try:
-            with open(file_path, encoding='utf-8') as file:
-                created_objects = model.objects.bulk_create(
-                    (model(**row) for row in json.load(file)),
-                    ignore_conflicts=True)
-            self.stdout.write(self.style.SUCCESS(
-                f'Импортировано {len(created_objects)} записей из {file_name}')
-            )
-        except Exception as e:
-            self.stdout.write(
-                self.style.WARNING(f'Ошибка обработки файла {file_name}: {e}'))
+            with open(file_path, encoding='utf-8', newline='') as file:
+                rows = islice(reader(file), processed, None)
+                while batch := list(islice(rows, batch_size)):
+                    with transaction.atomic():
+                        counts = self.import_batch(batch)
+                    processed += len(batch)
+                    self.save_checkpoint(file_path, processed)
+                    totals = [
+                        total + count for total, count in zip(totals, counts)]
+            if os.path.exists(f'{file_path}.checkpoint'):
+                os.remove(f'{file_path}.checkpoint')
+        except Exception as error:
+            self.stdout.write(self.get_summary(file_path, totals))
+            raise CommandError(
+                f'Ошибка обработки файла {file_path} после {processed} '
+                f'записей: {error}. Продолжить импорт можно c --resume'
+            ) from error
+        finally:
+            data_imported.send(sender=self.model)
+        self.stdout.write(self.style.SUCCESS(
+            self.get_summary(file_path, totals)))
+
+    def get_summary(self, file_path, totals):
+        created, updated, skipped = totals
+        return (f'Из {file_path}: добавлено {created}, обновлено {updated}, '
+                f'без изменений {skipped}')
+
+    def handle(self, *args, **options):
+        self.import_data(
+            options['path'], options['format'],
+            options['batch_size'], options['resume'])
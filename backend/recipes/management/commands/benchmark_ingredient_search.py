@@ -0,0 +1,45 @@
+from timeit import timeit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.models import Ingredient
+from recipes.search import ingredient_index
+
+QUERIES = ('а', 'мо', 'сол', 'картоф', 'масло', 'ица', 'перец черн')
+
+
+class Command(BaseCommand):
+    help = 'Сравнение поиска ингредиентов через ORM и индекс в памяти'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=100)
+
+    def search_orm(self, value):
+        """Прежний поиск через istartswith и icontains"""
+        ingredients = Ingredient.objects.all()
+        return list(
+            (ingredients.filter(name__istartswith=value)
+             | ingredients.filter(name__icontains=value)
+             .exclude(name__istartswith=value)).values_list('id', flat=True))
+
+    def search_index(self, value):
+        """Поиск через индекс и выборку найденных записей по id"""
+        ids = ingredient_index.search(value, settings.INGREDIENT_SEARCH_LIMIT)
+        return list(Ingredient.objects.filter(
+            id__in=ids).values_list('id', flat=True))
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        ingredient_index.refresh()
+        self.stdout.write(
+            f'Ингредиентов: {Ingredient.objects.count()}, '
+            f'повторов: {repeat}')
+        for value in QUERIES:
+            results = []
+            for search in (self.search_orm, self.search_index):
+                seconds = timeit(lambda: search(value), number=repeat)
+                results.append(seconds / repeat * 1000)
+            self.stdout.write(
+                f'{value!r}: ORM {results[0]:.3f} мс, '
+                f'индекс {results[1]:.3f} мс')
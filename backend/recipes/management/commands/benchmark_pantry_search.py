@@ -0,0 +1,76 @@
+import random
+from timeit import default_timer, timeit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, FloatField, Q
+from django.db.models.functions import Cast
+
+from recipes.models import Ingredient, Recipe
+from recipes.pantry import RecipeIngredientIndex
+
+SIZES = (1, 3, 5, 10, 20)
+LIMIT = 6
+
+
+class Command(BaseCommand):
+    help = ('Сравнение поиска рецептов по имеющимся продуктам через ORM '
+            'и обратный индекс в памяти. Для замера на 100 тысячах '
+            'рецептов: generate_data --recipes 100000')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def search_orm(self, ingredient_ids):
+        """Подсчет покрытия агрегатом по составу рецептов"""
+        return list(
+            Recipe.objects
+            .annotate(
+                matched=Count('recipe_ingredients', filter=Q(
+                    recipe_ingredients__ingredient__in=ingredient_ids)),
+                total=Count('recipe_ingredients'))
+            .filter(matched__gt=0)
+            .order_by(
+                (-Cast('matched', FloatField()) / F('total')).asc(),
+                (F('total') - F('matched')).asc(), '-id')
+            .values_list('id', flat=True)[:LIMIT])
+
+    def search_index(self, index, ingredient_ids):
+        """Ранжирование по индексу и выборка страницы по id"""
+        page = index.search(ingredient_ids)[:LIMIT]
+        return list(Recipe.objects.filter(
+            id__in=[recipe_id for recipe_id, _, _ in page]
+        ).values_list('id', flat=True))
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        ingredient_ids = list(Ingredient.objects.filter(
+            recipe_ingredients__isnull=False).distinct().values_list(
+                'id', flat=True))
+        if not ingredient_ids:
+            raise CommandError('Нет рецептов c продуктами')
+        index = RecipeIngredientIndex()
+        start = default_timer()
+        index.refresh()
+        self.stdout.write(
+            f'Рецептов: {Recipe.objects.count()}, повторов: {repeat}, '
+            f'построение индекса {default_timer() - start:.2f} с')
+        generator = random.Random(options['seed'])
+        for size in SIZES:
+            sample = generator.sample(
+                ingredient_ids, min(size, len(ingredient_ids)))
+            results = [
+                timeit(lambda: search(sample), number=repeat) / repeat * 1000
+                for search in (
+                    self.search_orm,
+                    lambda ids: self.search_index(index, ids))]
+            self.stdout.write(
+                f'продуктов {size:>2}: найдено {len(index.search(sample))}, '
+                f'ORM {results[0]:.2f} мс, индекс {results[1]:.2f} мс')
+        changed = generator.sample(
+            list(index.data[1]), min(100, len(index.data[1])))
+        start = default_timer()
+        index.data = index.apply_changes(set(changed))
+        self.stdout.write(
+            f'Обновление индекса для {len(changed)} рецептов: '
+            f'{(default_timer() - start) * 1000:.2f} мс')
@@ -0,0 +1,22 @@
+from timeit import default_timer
+
+from django.core.management.base import BaseCommand
+
+from recipes.similarity import refresh_similar_recipes
+
+
+class Command(BaseCommand):
+    help = ('Расчет похожих рецептов по общим продуктам и тегам: '
+            'только измененные рецепты или все c --full')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Пересчитать соседей всех рецептов')
+
+    def handle(self, *args, **options):
+        start = default_timer()
+        stale, updated = refresh_similar_recipes(options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано рецептов: {stale}, обновлено списков: {updated} '
+            f'за {default_timer() - start:.2f} с'))
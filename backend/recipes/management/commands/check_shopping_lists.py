@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import ShoppingListItem
+from recipes.shopping_list import build_shopping_lists
+
+
+class Command(BaseCommand):
+    help = 'Сверка списков покупок с корзинами и их пересборка'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='Пересобрать списки покупок при расхождениях')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        expected = build_shopping_lists()
+        stored = {
+            (user, ingredient): amount
+            for user, ingredient, amount in ShoppingListItem.objects
+            .values_list('user', 'ingredient', 'amount')}
+        missing = expected.keys() - stored.keys()
+        extra = stored.keys() - expected.keys()
+        changed = [
+            key for key in expected.keys() & stored.keys()
+            if expected[key] != stored[key]]
+        for title, keys in (('Отсутствуют', missing), ('Лишние', extra),
+                            ('Расходится количество', changed)):
+            self.stdout.write(f'{title}: {len(keys)}')
+            for user, ingredient in sorted(keys):
+                self.stdout.write(
+                    f'  пользователь {user}, продукт {ingredient}: '
+                    f'{stored.get((user, ingredient))} -> '
+                    f'{expected.get((user, ingredient))}')
+        if not (missing or extra or changed):
+            self.stdout.write(self.style.SUCCESS('Расхождений нет'))
+            return
+        if options['fix']:
+            ShoppingListItem.objects.all().delete()
+            ShoppingListItem.objects.bulk_create(
+                ShoppingListItem(
+                    user_id=user, ingredient_id=ingredient, amount=amount)
+                for (user, ingredient), amount in expected.items())
+            self.stdout.write(self.style.SUCCESS('Списки покупок пересобраны'))
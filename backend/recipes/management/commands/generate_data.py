@@ -0,0 +1,156 @@
+import random
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+
+from recipes.counters import COUNTERS, recount
+from recipes.feed import rebuild_feeds
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    ShoppingListItem,
+    Subscription,
+    Tag,
+    User
+)
+from recipes.search import get_recipe_search
+from recipes.shopping_list import build_shopping_lists
+from recipes.signals import data_imported
+
+IMAGE_NAME = 'recipes/images/generated.png'
+BATCH_SIZE = 1000
+WORDS = (
+    'суп', 'борщ', 'салат', 'пирог', 'каша', 'рагу', 'омлет', 'плов',
+    'запеканка', 'котлеты', 'блины', 'соус', 'домашний', 'быстрый',
+    'летний', 'острый', 'сырный', 'грибной', 'овощной', 'куриный')
+
+
+class Command(BaseCommand):
+    help = ('Генерация пользователей, рецептов, избранного, корзин '
+            'и подписок для нагрузочных тестов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument(
+            '--ingredients', type=int, default=8,
+            help='Продуктов в рецепте')
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Рецептов в избранном у пользователя')
+        parser.add_argument(
+            '--carts', type=int, default=5,
+            help='Рецептов в корзине у пользователя')
+        parser.add_argument(
+            '--subscriptions', type=int, default=10,
+            help='Подписок у пользователя')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--prefix', default='benchmark',
+            help='Префикс имен создаваемых пользователей')
+
+    def get_image(self):
+        """Одно изображение на все рецепты"""
+        if not default_storage.exists(IMAGE_NAME):
+            buffer = BytesIO()
+            Image.new('RGB', (64, 64), 'orange').save(buffer, 'PNG')
+            default_storage.save(IMAGE_NAME, ContentFile(buffer.getvalue()))
+        return IMAGE_NAME
+
+    def create_users(self, prefix, count):
+        password = make_password(prefix)
+        User.objects.bulk_create(
+            (User(username=f'{prefix}{index}',
+                  email=f'{prefix}{index}@example.com',
+                  first_name='Пользователь', last_name=str(index),
+                  password=password)
+             for index in range(count)),
+            batch_size=BATCH_SIZE)
+        return list(User.objects.filter(
+            username__startswith=prefix).order_by('id').values_list(
+                'id', flat=True))
+
+    def create_recipes(self, generator, prefix, user_ids, count):
+        image = self.get_image()
+        Recipe.objects.bulk_create(
+            (Recipe(author_id=generator.choice(user_ids),
+                    name=' '.join(generator.sample(WORDS, 3)).capitalize(),
+                    text=' '.join(generator.choices(WORDS, k=30)),
+                    cooking_time=generator.randint(5, 180),
+                    image=image)
+             for _ in range(count)),
+            batch_size=BATCH_SIZE)
+        return list(Recipe.objects.filter(
+            author__username__startswith=prefix
+        ).order_by('id').values_list('id', flat=True))
+
+    def create_relations(self, model, objects):
+        model.objects.bulk_create(
+            objects, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Пользователи c префиксом {prefix} уже есть, '
+                'укажите другой --prefix')
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        if len(ingredient_ids) < options['ingredients'] or not tag_ids:
+            raise CommandError(
+                'Сначала импортируйте продукты и теги: '
+                'import_ingredients, import_tags')
+        generator = random.Random(options['seed'])
+        user_ids = self.create_users(prefix, options['users'])
+        recipe_ids = self.create_recipes(
+            generator, prefix, user_ids, options['recipes'])
+        self.create_relations(RecipeIngredient, (
+            RecipeIngredient(
+                recipe_id=recipe_id, ingredient_id=ingredient_id,
+                amount=generator.randint(1, 500))
+            for recipe_id in recipe_ids
+            for ingredient_id in generator.sample(
+                ingredient_ids, options['ingredients'])))
+        self.create_relations(Recipe.tags.through, (
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in generator.sample(
+                tag_ids, generator.randint(1, min(3, len(tag_ids))))))
+        for model, option in ((Favorite, 'favorites'),
+                              (ShoppingCart, 'carts')):
+            self.create_relations(model, (
+                model(user_id=user_id, recipe_id=recipe_id)
+                for user_id in user_ids
+                for recipe_id in generator.sample(
+                    recipe_ids, min(options[option], len(recipe_ids)))))
+        subscriptions = min(options['subscriptions'], len(user_ids) - 1)
+        self.create_relations(Subscription, (
+            Subscription(subscriber_id=user_id, subscribed_to_id=author_id)
+            for user_id in user_ids
+            for author_id in [
+                pk for pk in generator.sample(user_ids, subscriptions + 1)
+                if pk != user_id][:subscriptions]))
+        for counter in COUNTERS:
+            recount(*counter)
+        rebuild_feeds(user_ids)
+        user_set = set(user_ids)
+        self.create_relations(ShoppingListItem, (
+            ShoppingListItem(
+                user_id=user_id, ingredient_id=ingredient_id, amount=amount)
+            for (user_id, ingredient_id), amount
+            in build_shopping_lists().items() if user_id in user_set))
+        get_recipe_search().update(
+            Recipe.objects.filter(author__username__startswith=prefix))
+        data_imported.send(sender=Recipe)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(user_ids)}, '
+            f'рецептов: {len(recipe_ids)}'))
@@ -4,13 +4,13 @@ from ._base import BaseImportCommand
 
 
 class Command(BaseImportCommand):
-    help = 'Импорт ингредиентов из JSON'
+    help = 'Импорт ингредиентов из JSON, CSV или NDJSON'
     file_name = 'ingredients.json'
     model = Ingredient
-    fields = ['name', 'measurement_unit']
+    lookup_fields = ('name',)
+    update_fields = ('measurement_unit',)
 
     def handle(self, *args, **options):
-        path = options['path']
-        self.stdout.write(f'Импорт ингредиентов из {path}')
-        self.import_data(self.file_name, self.model, self.fields)
+        self.stdout.write(f'Импорт ингредиентов из {options["path"]}')
+        super().handle(*args, **options)
         self.stdout.write(self.style.SUCCESS('Импорт ингредиентов завершен'))
@@ -4,13 +4,13 @@ from ._base import BaseImportCommand
 
 
 class Command(BaseImportCommand):
-    help = 'Импорт тегов из JSON'
+    help = 'Импорт тегов из JSON, CSV или NDJSON'
     file_name = 'tags.json'
     model = Tag
-    fields = ['name', 'slug']
+    lookup_fields = ('slug',)
+    update_fields = ('name',)
 
     def handle(self, *args, **options):
-        path = options['path']
-        self.stdout.write(f'Импорт тегов из {path}')
-        self.import_data(self.file_name, self.model, self.fields)
+        self.stdout.write(f'Импорт тегов из {options["path"]}')
+        super().handle(*args, **options)
         self.stdout.write(self.style.SUCCESS('Импорт тегов завершен'))
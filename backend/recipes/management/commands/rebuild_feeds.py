@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.feed import rebuild_feeds
+
+
+class Command(BaseCommand):
+    help = 'Заполнение лент подписок по текущим подпискам и рецептам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append',
+            help='id пользователя, по умолчанию все пользователи')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        users = rebuild_feeds(options['user'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты заполнены для пользователей: {users}'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.counters import COUNTERS, get_drift, recount
+
+
+class Command(BaseCommand):
+    help = 'Пересчет счетчиков избранного, списков покупок и подписок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только показать расхождения, не исправляя их')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        for counter in COUNTERS:
+            model, field = counter[:2]
+            name = f'{model.__name__}.{field}'
+            drift = get_drift(*counter)
+            if not drift:
+                self.stdout.write(f'{name}: расхождений нет')
+                continue
+            self.stdout.write(self.style.WARNING(
+                f'{name}: расхождений {drift}'))
+            if not options['check']:
+                recount(*counter)
+                self.stdout.write(self.style.SUCCESS(f'{name}: пересчитан'))
@@ -1,4 +1,5 @@
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models
 
@@ -9,7 +10,21 @@ from .constants import (
 )
 
 
-class User(AbstractUser):
+class CountersMixin:
+    """Миксин исключает счетчики из полного сохранения объекта:
+    их меняют только атомарные UPDATE c F-выражениями"""
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            skipped = {*self.counter_fields, *self.get_deferred_fields()}
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped]
+        super().save(*args, **kwargs)
+
+
+class User(CountersMixin, AbstractUser):
     """Модель пользователя"""
     email = models.EmailField('Электронная почта', max_length=254, unique=True)
     username = models.CharField('Никнейм', max_length=150, unique=True,
@@ -18,9 +33,19 @@ class User(AbstractUser):
     last_name = models.CharField('Фамилия', max_length=150)
     avatar = models.ImageField(
         'Аватар', upload_to='users/avatars/', blank=True, null=True,)
+    avatar_renditions = models.JSONField(
+        'Копии аватара', default=dict, editable=False)
+    recipes_count = models.PositiveIntegerField(
+        'Число рецептов', default=0, editable=False)
+    subscriptions_count = models.PositiveIntegerField(
+        'Число подписок', default=0, editable=False)
+    followers_count = models.PositiveIntegerField(
+        'Число подписчиков', default=0, editable=False)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'first_name', 'last_name')
+    counter_fields = (
+        'recipes_count', 'subscriptions_count', 'followers_count')
 
     class Meta:
         verbose_name = 'пользователь'
@@ -89,12 +114,14 @@ class Ingredient(models.Model):
         return f'{self.name} ({self.measurement_unit})'
 
 
-class Recipe(models.Model):
+class Recipe(CountersMixin, models.Model):
     """Модель рецепта"""
     author = models.ForeignKey(
         User, verbose_name='Автор', on_delete=models.CASCADE)
     name = models.CharField('Название', max_length=MAX_LENGTH_RECIPE_NAME)
     image = models.ImageField('Изображение', upload_to='recipes/images/')
+    image_renditions = models.JSONField(
+        'Копии изображения', default=dict, editable=False)
     text = models.TextField('Описание')
     ingredients = models.ManyToManyField(
         Ingredient, through='RecipeIngredient', verbose_name='Ингредиенты')
@@ -103,12 +130,32 @@ class Recipe(models.Model):
         'Время (мин)',
         validators=(MinValueValidator(MIN_COOKING_TIME),))
     pub_date = models.DateTimeField('Дата публикации', auto_now_add=True)
+    favorites_count = models.PositiveIntegerField(
+        'В избранном', default=0, editable=False)
+    shopping_carts_count = models.PositiveIntegerField(
+        'В списках покупок', default=0, editable=False)
+    short_link_clicks = models.PositiveIntegerField(
+        'Переходов по короткой ссылке', default=0, editable=False)
+    search_vector = SearchVectorField(
+        'Поисковый вектор', null=True, editable=False)
+    similar_stale = models.BooleanField(
+        'Похожие рецепты устарели', default=True, editable=False)
+
+    counter_fields = (
+        'favorites_count', 'shopping_carts_count', 'short_link_clicks')
 
     class Meta:
         verbose_name = 'рецепт'
         verbose_name_plural = 'Рецепты'
         default_related_name = 'recipes'
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'), name='recipe_pub_date_id_idx'),
+            models.Index(
+                fields=('id',), condition=models.Q(similar_stale=True),
+                name='recipe_similar_stale_idx'),
+        )
 
     def __str__(self):
         return self.name[:40]
@@ -147,6 +194,8 @@ class UserRecipeBaseModel(models.Model):
         constraints = [models.UniqueConstraint(
             fields=['user', 'recipe'],
             name='unique_%(class)s_user_recipe')]
+        indexes = [models.Index(
+            fields=['recipe', 'user'], name='%(class)s_recipe_user_idx')]
 
     def __str__(self):
         return f'{self.user} добавил {self.recipe}'
@@ -166,3 +215,75 @@ class ShoppingCart(UserRecipeBaseModel):
         verbose_name = 'список покупок'
         verbose_name_plural = 'Списки покупок'
         default_related_name = 'cart_items'
+
+
+class FeedEntry(models.Model):
+    """Модель записи ленты подписок: рецепт автора, на которого
+    подписан пользователь, записанный в ленту при публикации"""
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, verbose_name='Пользователь')
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, verbose_name='Рецепт')
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='+',
+        verbose_name='Автор')
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = 'запись ленты'
+        verbose_name_plural = 'Записи лент'
+        default_related_name = 'feed_entries'
+        constraints = [models.UniqueConstraint(
+            fields=['user', 'recipe'], name='unique_feed_entry')]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_entry_user_pub_date_idx'),
+            models.Index(
+                fields=['user', 'author'], name='feed_entry_user_author_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
+
+
+class SimilarRecipe(models.Model):
+    """Модель похожего рецепта: один из ближайших соседей рецепта
+    по общим продуктам и тегам, рассчитанный заранее"""
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, verbose_name='Рецепт')
+    similar = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='+',
+        verbose_name='Похожий рецепт')
+    score = models.FloatField('Сходство')
+
+    class Meta:
+        verbose_name = 'похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        default_related_name = 'similar_recipes'
+        constraints = [models.UniqueConstraint(
+            fields=['recipe', 'similar'], name='unique_similar_recipe')]
+
+    def __str__(self):
+        return f'{self.similar} похож на {self.recipe} ({self.score:.2f})'
+
+
+class ShoppingListItem(models.Model):
+    """Модель суммарного количества продукта в списке покупок
+    пользователя, поддерживаемая при изменении корзины и рецептов"""
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, verbose_name='Пользователь')
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE, verbose_name='Продукт')
+    amount = models.PositiveIntegerField('Количество', default=0)
+
+    class Meta:
+        verbose_name = 'продукт в списке покупок'
+        verbose_name_plural = 'Продукты в списках покупок'
+        default_related_name = 'shopping_list_items'
+        constraints = [models.UniqueConstraint(
+            fields=['user', 'ingredient'],
+            name='unique_shopping_list_item')]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} - {self.amount}'
@@ -0,0 +1,153 @@
+import threading
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from heapq import nsmallest
+
+from django.core.cache import cache
+
+from .models import RecipeIngredient
+from .versions import bump_version, get_version
+
+VERSION_KEY = 'recipe-ingredients:version'
+CHANGE_KEY = 'recipe-ingredients:change:{}'
+CHANGE_TIMEOUT = 24 * 60 * 60
+MAX_CHANGES = 1000
+
+
+def invalidate_recipe_ingredients(recipe_ids=None):
+    """Помечает индекс продуктов рецептов устаревшим во всех процессах.
+    Изменившиеся рецепты сохраняются в журнале под новой версией,
+    без них процессы перестраивают индекс полностью"""
+    def log_changes(version):
+        if recipe_ids is not None:
+            cache.set(
+                CHANGE_KEY.format(version), list(recipe_ids), CHANGE_TIMEOUT)
+    bump_version(VERSION_KEY, callback=log_changes)
+
+
+def contains_sorted(values, value):
+    position = bisect_left(values, value)
+    return position < len(values) and values[position] == value
+
+
+def remove_sorted(values, value):
+    del values[bisect_left(values, value)]
+
+
+class CoverageRanking:
+    """Найденные рецепты по убыванию доли имеющихся продуктов, затем
+    по числу недостающих и от новых к старым. Сортируется только начало
+    списка, нужное для запрошенной страницы"""
+
+    def __init__(self, matched, sizes):
+        self.matched = matched
+        self.sizes = sizes
+
+    def __len__(self):
+        return len(self.matched)
+
+    def get_key(self, item):
+        recipe_id, count = item
+        size = self.sizes[recipe_id]
+        return -count / size, size - count, -recipe_id
+
+    def __getitem__(self, index):
+        top = nsmallest(
+            index.stop, self.matched.items(), key=self.get_key)[index]
+        return [
+            (recipe_id, count, self.sizes[recipe_id] - count)
+            for recipe_id, count in top]
+
+
+class RecipeIngredientIndex:
+    """Обратный индекс продукт → отсортированный массив id рецептов
+    в памяти процесса. При смене версии применяет изменения из журнала
+    или перестраивается целиком"""
+
+    def __init__(self):
+        self.version = None
+        self.data = ({}, {})
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Строит индекс и число продуктов каждого рецепта"""
+        recipes, sizes = defaultdict(lambda: array('q')), Counter()
+        for ingredient_id, recipe_id in (
+                RecipeIngredient.objects
+                .order_by('ingredient_id', 'recipe_id')
+                .values_list('ingredient_id', 'recipe_id').iterator()):
+            recipes[ingredient_id].append(recipe_id)
+            sizes[recipe_id] += 1
+        return dict(recipes), dict(sizes)
+
+    def apply_changes(self, recipe_ids):
+        """Новая копия индекса c перечитанным составом рецептов.
+        Копируются только массивы затронутых продуктов"""
+        recipes, sizes = self.data
+        recipes, sizes = dict(recipes), dict(sizes)
+        copied = set()
+
+        def get_array(ingredient_id):
+            if ingredient_id not in copied:
+                recipes[ingredient_id] = array(
+                    'q', recipes.get(ingredient_id, ()))
+                copied.add(ingredient_id)
+            return recipes[ingredient_id]
+
+        for ingredient_id, values in self.data[0].items():
+            for recipe_id in recipe_ids:
+                if contains_sorted(values, recipe_id):
+                    remove_sorted(get_array(ingredient_id), recipe_id)
+        for recipe_id in recipe_ids:
+            sizes.pop(recipe_id, None)
+        for ingredient_id, recipe_id in RecipeIngredient.objects.filter(
+                recipe_id__in=recipe_ids).values_list(
+                    'ingredient_id', 'recipe_id'):
+            insort(get_array(ingredient_id), recipe_id)
+            sizes[recipe_id] = sizes.get(recipe_id, 0) + 1
+        return recipes, sizes
+
+    def get_changes(self, version):
+        """id рецептов, изменившихся c версии процесса, или None,
+        если журнал неполон"""
+        if self.version is None or not 0 < version - self.version <= (
+                MAX_CHANGES):
+            return None
+        keys = [CHANGE_KEY.format(number)
+                for number in range(self.version + 1, version + 1)]
+        changes = cache.get_many(keys)
+        if len(changes) != len(keys):
+            return None
+        return set().union(*changes.values())
+
+    def refresh(self):
+        """Обновляет индекс, если продукты рецептов изменились"""
+        version = get_version(VERSION_KEY)
+        if version == self.version:
+            return
+        with self.lock:
+            if version == self.version:
+                return
+            changes = self.get_changes(version)
+            self.data = (
+                self.load() if changes is None
+                else self.apply_changes(changes))
+            self.version = version
+
+    def search(self, ingredient_ids, max_missing=None):
+        """Рецепты хотя бы c одним из продуктов, ранжированные по покрытию:
+        пересечение множеств считается по индексу без запросов к базе"""
+        self.refresh()
+        recipes, sizes = self.data
+        matched = Counter()
+        for ingredient_id in set(ingredient_ids):
+            matched.update(recipes.get(ingredient_id, ()))
+        if max_missing is not None:
+            matched = {
+                recipe_id: count for recipe_id, count in matched.items()
+                if sizes[recipe_id] - count <= max_missing}
+        return CoverageRanking(matched, sizes)
+
+
+recipe_ingredient_index = RecipeIngredientIndex()
@@ -0,0 +1,214 @@
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchHeadline,
+    SearchQuery,
+    SearchRank,
+    SearchVector
+)
+from django.db import connection, transaction
+from django.db.models import (
+    Case,
+    Exists,
+    F,
+    OuterRef,
+    Q,
+    Subquery,
+    TextField,
+    Value,
+    When
+)
+from django.db.models.functions import (
+    Coalesce,
+    Concat,
+    Greatest,
+    Lower,
+    StrIndex,
+    Substr
+)
+from django.utils.html import escape
+
+from .models import Ingredient, RecipeIngredient
+from .versions import bump_version, get_version
+
+INGREDIENTS_VERSION_KEY = 'ingredients:version'
+TRIGRAM_LENGTH = 3
+SNIPPET_START = '\x02'
+SNIPPET_STOP = '\x03'
+HIGHLIGHT_START = '<b>'
+HIGHLIGHT_STOP = '</b>'
+SNIPPET_CONTEXT = 60
+
+
+def get_trigrams(text):
+    """Возвращает множество триграмм строки"""
+    return {text[i:i + TRIGRAM_LENGTH]
+            for i in range(len(text) - TRIGRAM_LENGTH + 1)}
+
+
+def render_snippet(snippet):
+    """Экранирует HTML в фрагменте описания рецепта и только после этого
+    заменяет служебные метки совпадений тегами выделения"""
+    return escape(snippet).replace(SNIPPET_START, HIGHLIGHT_START).replace(
+        SNIPPET_STOP, HIGHLIGHT_STOP)
+
+
+def invalidate_ingredient_index():
+    """Помечает индексы ингредиентов во всех процессах устаревшими"""
+    bump_version(INGREDIENTS_VERSION_KEY)
+
+
+class IngredientIndex:
+    """Индекс названий ингредиентов в памяти процесса для автодополнения.
+    Загружается при первом поиске и перечитывается при смене версии"""
+
+    def __init__(self):
+        self.version = None
+        self.data = ([], {})
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Строит отсортированный список названий и индекс триграмм"""
+        names = sorted(
+            (name.lower(), pk)
+            for pk, name in Ingredient.objects.values_list('id', 'name'))
+        trigrams = defaultdict(set)
+        for position, (name, _) in enumerate(names):
+            for trigram in get_trigrams(name):
+                trigrams[trigram].add(position)
+        return names, dict(trigrams)
+
+    def refresh(self):
+        """Перестраивает индекс, если ингредиенты изменились"""
+        version = get_version(INGREDIENTS_VERSION_KEY)
+        if version == self.version:
+            return
+        with self.lock:
+            if version != self.version:
+                self.data = self.load()
+                self.version = version
+
+    def get_candidates(self, names, trigrams, value):
+        """Позиции названий, которые могут содержать подстроку"""
+        if len(value) < TRIGRAM_LENGTH:
+            return range(len(names))
+        positions = None
+        for trigram in get_trigrams(value):
+            matches = trigrams.get(trigram, set())
+            positions = matches if positions is None else positions & matches
+            if not positions:
+                return ()
+        return sorted(positions)
+
+    def search(self, value, limit):
+        """Возвращает id ингредиентов: сначала совпадения по началу
+        названия, затем по вхождению в произвольном месте"""
+        self.refresh()
+        names, trigrams = self.data
+        value = value.lower()
+        prefix_ids = []
+        position = bisect_left(names, (value,))
+        while (position < len(names) and len(prefix_ids) < limit
+               and names[position][0].startswith(value)):
+            prefix_ids.append(names[position][1])
+            position += 1
+        substring_ids = []
+        for position in self.get_candidates(names, trigrams, value):
+            if len(prefix_ids) + len(substring_ids) >= limit:
+                break
+            name, pk = names[position]
+            if value in name and not name.startswith(value):
+                substring_ids.append(pk)
+        return prefix_ids + substring_ids
+
+
+ingredient_index = IngredientIndex()
+
+
+class PostgresRecipeSearch:
+    """Полнотекстовый поиск рецептов по tsvector c GIN-индексом.
+    Вектор собирается из названия, продуктов и описания c весами A, B, C"""
+
+    def update(self, recipes):
+        """Пересчитывает поисковый вектор рецептов одним UPDATE"""
+        config = settings.RECIPE_SEARCH_CONFIG
+        ingredient_names = (
+            RecipeIngredient.objects
+            .filter(recipe=OuterRef('pk'))
+            .values('recipe')
+            .annotate(names=StringAgg('ingredient__name', ' '))
+            .values('names'))
+        recipes.update(search_vector=(
+            SearchVector('name', weight='A', config=config)
+            + SearchVector(
+                Coalesce(
+                    Subquery(ingredient_names), Value(''),
+                    output_field=TextField()),
+                weight='B', config=config)
+            + SearchVector('text', weight='C', config=config)))
+
+    def search(self, recipes, value):
+        """Отбирает рецепты по запросу и сортирует по релевантности"""
+        config = settings.RECIPE_SEARCH_CONFIG
+        query = SearchQuery(value, config=config, search_type='websearch')
+        return recipes.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query),
+            search_snippet=SearchHeadline(
+                'text', query, config=config,
+                start_sel=SNIPPET_START, stop_sel=SNIPPET_STOP,
+                max_words=35, min_words=15),
+        ).order_by('-search_rank', '-pub_date', '-id')
+
+
+class SimpleRecipeSearch:
+    """Поиск рецептов по вхождению подстроки для баз без полнотекстового
+    поиска (SQLite в тестах и локальной разработке)"""
+
+    def update(self, recipes):
+        """Поисковый вектор не используется"""
+
+    def search(self, recipes, value):
+        """Отбирает рецепты c подстрокой в названии, продуктах
+        или описании, выше ставит совпадения в названии"""
+        in_name = Q(name__icontains=value)
+        in_ingredients = Exists(RecipeIngredient.objects.filter(
+            recipe=OuterRef('pk'), ingredient__name__icontains=value))
+        in_text = Q(text__icontains=value)
+        position = F('search_position')
+        start = Greatest(position - SNIPPET_CONTEXT, 1)
+        return recipes.filter(in_name | in_ingredients | in_text).annotate(
+            search_position=StrIndex(Lower('text'), Value(value.lower())),
+            search_rank=(
+                Case(When(in_name, then=3), default=0)
+                + Case(When(in_ingredients, then=2), default=0)
+                + Case(When(in_text, then=1), default=0)),
+        ).annotate(search_snippet=Case(
+            When(search_position=0, then=Substr('text', 1, SNIPPET_CONTEXT)),
+            default=Concat(
+                Substr('text', start, position - start),
+                Value(SNIPPET_START),
+                Substr('text', position, len(value)),
+                Value(SNIPPET_STOP),
+                Substr('text', position + len(value), SNIPPET_CONTEXT),
+                output_field=TextField()),
+            output_field=TextField(),
+        )).order_by('-search_rank', '-pub_date', '-id')
+
+
+RECIPE_SEARCH_ENGINES = {'postgresql': PostgresRecipeSearch}
+
+
+def get_recipe_search():
+    """Возвращает движок поиска рецептов для текущей базы данных"""
+    return RECIPE_SEARCH_ENGINES.get(
+        connection.vendor, SimpleRecipeSearch)()
+
+
+def update_search_vectors(recipes):
+    """Пересчитывает поисковые векторы после фиксации транзакции,
+    когда продукты рецепта уже сохранены"""
+    transaction.on_commit(lambda: get_recipe_search().update(recipes))
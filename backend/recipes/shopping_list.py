@@ -0,0 +1,76 @@
+from collections import Counter
+
+from django.db.models import Case, F, Sum, Value, When
+from django.db.models.functions import Greatest
+
+from .models import RecipeIngredient, ShoppingCart, ShoppingListItem
+
+
+def get_recipe_amounts(recipe_ids):
+    """Суммарное количество продуктов в рецептах по id продукта"""
+    return dict(
+        RecipeIngredient.objects
+        .filter(recipe__in=recipe_ids)
+        .values('ingredient')
+        .annotate(total_amount=Sum('amount'))
+        .values_list('ingredient', 'total_amount'))
+
+
+def apply_shopping_list_deltas(user_ids, deltas):
+    """Изменяет количество продуктов в списках покупок пользователей:
+    создает недостающие строки, одним UPDATE применяет изменения
+    и удаляет продукты с нулевым количеством"""
+    user_ids = list(user_ids)
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not user_ids or not deltas:
+        return
+    ShoppingListItem.objects.bulk_create(
+        (ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id)
+         for user_id in user_ids
+         for ingredient_id, delta in deltas.items() if delta > 0),
+        ignore_conflicts=True)
+    items = ShoppingListItem.objects.filter(
+        user__in=user_ids, ingredient__in=deltas)
+    items.update(amount=Greatest(F('amount') + Case(
+        *(When(ingredient_id=pk, then=Value(delta))
+          for pk, delta in deltas.items()),
+        default=Value(0)), 0))
+    items.filter(amount=0).delete()
+
+
+def add_recipes_to_shopping_list(user_id, recipe_ids):
+    """Добавляет продукты рецептов в список покупок пользователя"""
+    apply_shopping_list_deltas((user_id,), get_recipe_amounts(recipe_ids))
+
+
+def remove_recipes_from_shopping_list(user_id, recipe_ids):
+    """Убирает продукты рецептов из списка покупок пользователя"""
+    apply_shopping_list_deltas((user_id,), {
+        pk: -amount
+        for pk, amount in get_recipe_amounts(recipe_ids).items()})
+
+
+def update_recipe_in_shopping_lists(recipe_id, old_amounts, new_amounts=None):
+    """Переносит изменение состава рецепта в списки покупок
+    всех пользователей, у которых рецепт в корзине.
+    Без new_amounts текущий состав читается из базы"""
+    deltas = Counter(
+        get_recipe_amounts((recipe_id,)) if new_amounts is None
+        else new_amounts)
+    deltas.subtract(old_amounts)
+    apply_shopping_list_deltas(
+        ShoppingCart.objects.filter(
+            recipe=recipe_id).values_list('user', flat=True),
+        deltas)
+
+
+def build_shopping_lists():
+    """Строит списки покупок всех пользователей с нуля по корзинам"""
+    return {
+        (item['recipe__cart_items__user'], item['ingredient']):
+            item['total_amount']
+        for item in RecipeIngredient.objects
+        .filter(recipe__cart_items__isnull=False)
+        .values('recipe__cart_items__user', 'ingredient')
+        .annotate(total_amount=Sum('amount'))
+        .order_by()}
@@ -0,0 +1,147 @@
+import atexit
+import hashlib
+import hmac
+import string
+import threading
+from collections import Counter, defaultdict
+from time import monotonic
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .counters import change_counter
+from .models import Recipe
+
+ALPHABET = string.digits + string.ascii_letters
+CHECK_ALPHABET = string.ascii_letters
+HALF_BITS = 20
+HALF_MASK = (1 << HALF_BITS) - 1
+ROUNDS = 4
+EXISTS_KEY = 'short-link:recipe:{}'
+
+
+def get_digest(*parts):
+    """HMAC от частей кода на секретном ключе проекта"""
+    return hmac.new(
+        f'short-links:{settings.SECRET_KEY}'.encode(),
+        ':'.join(map(str, parts)).encode(), hashlib.sha256).digest()
+
+
+def get_round_value(value, round_number):
+    digest = get_digest('round', round_number, value)
+    return int.from_bytes(digest[:4], 'big') & HALF_MASK
+
+
+def permute(number):
+    """Обратимая перестановка чисел до 2**40: сеть Фейстеля c HMAC"""
+    left, right = number >> HALF_BITS, number & HALF_MASK
+    for round_number in range(ROUNDS):
+        left, right = right, left ^ get_round_value(right, round_number)
+    return left << HALF_BITS | right
+
+
+def unpermute(number):
+    left, right = number >> HALF_BITS, number & HALF_MASK
+    for round_number in reversed(range(ROUNDS)):
+        left, right = right ^ get_round_value(left, round_number), left
+    return left << HALF_BITS | right
+
+
+def to_base62(number):
+    digits = []
+    while True:
+        number, digit = divmod(number, len(ALPHABET))
+        digits.append(ALPHABET[digit])
+        if not number:
+            return ''.join(reversed(digits))
+
+
+def from_base62(code):
+    number = 0
+    for char in code:
+        number = number * len(ALPHABET) + ALPHABET.index(char)
+    return number
+
+
+def get_check_char(pk):
+    """Контрольная буква кода: отсекает случайные коды без запроса
+    к базе и отличает код от числового адреса /s/<pk>/"""
+    digest = get_digest('check', pk)
+    return CHECK_ALPHABET[
+        int.from_bytes(digest[:4], 'big') % len(CHECK_ALPHABET)]
+
+
+def encode_code(pk):
+    """Короткий код рецепта: контрольная буква и pk в base62,
+    при SHORT_LINK_OBFUSCATE pk предварительно перемешивается"""
+    number = permute(pk) if settings.SHORT_LINK_OBFUSCATE else pk
+    return get_check_char(pk) + to_base62(number)
+
+
+def decode_code(code):
+    """pk рецепта по короткому коду или None для неверного кода"""
+    if len(code) < 2 or any(char not in ALPHABET for char in code[1:]):
+        return None
+    number = from_base62(code[1:])
+    if settings.SHORT_LINK_OBFUSCATE:
+        if number >> 2 * HALF_BITS:
+            return None
+        number = unpermute(number)
+    if not number or code[0] != get_check_char(number):
+        return None
+    return number
+
+
+def recipe_exists(pk):
+    """Существует ли рецепт: ответ кэшируется, отсутствие — недолго"""
+    key = EXISTS_KEY.format(pk)
+    exists = cache.get(key)
+    if exists is None:
+        exists = Recipe.objects.filter(pk=pk).exists()
+        cache.set(key, exists, (
+            settings.SHORT_LINK_CACHE_TIMEOUT if exists
+            else settings.SHORT_LINK_MISSING_CACHE_TIMEOUT))
+    return exists
+
+
+def invalidate_recipe_exists(pk):
+    """Сбрасывает кэш существования рецепта после фиксации транзакции"""
+    transaction.on_commit(lambda: cache.delete(EXISTS_KEY.format(pk)))
+
+
+class ClickBuffer:
+    """Переходы по коротким ссылкам в памяти процесса.
+    Записываются в базу пачкой по размеру или по времени"""
+
+    def __init__(self):
+        self.clicks = Counter()
+        self.pending = 0
+        self.flushed_at = monotonic()
+        self.lock = threading.Lock()
+
+    def add(self, pk):
+        with self.lock:
+            self.clicks[pk] += 1
+            self.pending += 1
+            if (self.pending < settings.SHORT_LINK_FLUSH_SIZE
+                    and monotonic() - self.flushed_at
+                    < settings.SHORT_LINK_FLUSH_INTERVAL):
+                return
+        self.flush()
+
+    def flush(self):
+        """Один UPDATE на каждое встречающееся приращение"""
+        with self.lock:
+            clicks, self.clicks = self.clicks, Counter()
+            self.pending = 0
+            self.flushed_at = monotonic()
+        pks_by_delta = defaultdict(list)
+        for pk, delta in clicks.items():
+            pks_by_delta[delta].append(pk)
+        for delta, pks in pks_by_delta.items():
+            change_counter(Recipe, pks, 'short_link_clicks', delta)
+
+
+click_buffer = ClickBuffer()
+atexit.register(click_buffer.flush)
@@ -0,0 +1,242 @@
+from threading import local
+
+from django.db.models.signals import (
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save
+)
+from django.dispatch import Signal, receiver
+
+from .counters import RECIPE_COUNTERS, change_counter
+from .feed import backfill_feed, fan_out_recipe, trim_feed
+from .images import delete_renditions, schedule_image_processing
+from .models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    SimilarRecipe,
+    Subscription,
+    Tag,
+    User
+)
+from .pantry import invalidate_recipe_ingredients
+from .search import invalidate_ingredient_index, update_search_vectors
+from .shopping_list import (
+    add_recipes_to_shopping_list,
+    remove_recipes_from_shopping_list
+)
+from .short_links import invalidate_recipe_exists
+from .tags import invalidate_tag_slugs
+
+data_imported = Signal()
+deleting = local()
+
+
+def get_deleting_recipes():
+    """id рецептов, удаляемых в текущем потоке"""
+    if not hasattr(deleting, 'recipe_ids'):
+        deleting.recipe_ids = set()
+    return deleting.recipe_ids
+
+
+@receiver(pre_delete, sender=Recipe)
+def remember_deleting_recipe(instance, **kwargs):
+    """Запоминает удаляемый рецепт: его состав удаляется каскадно,
+    и обработчики строк состава не должны пересчитывать индексы"""
+    get_deleting_recipes().add(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def forget_deleting_recipe(instance, **kwargs):
+    get_deleting_recipes().discard(instance.pk)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(data_imported, sender=Ingredient)
+def refresh_ingredient_index(**kwargs):
+    """Обновляет индекс автодополнения при изменении ингредиентов"""
+    invalidate_ingredient_index()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(data_imported, sender=Tag)
+def refresh_tag_slugs(**kwargs):
+    """Обновляет кэш слагов тегов при изменении тегов"""
+    invalidate_tag_slugs()
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(instance, created, **kwargs):
+    """Увеличивает число рецептов автора"""
+    if created:
+        change_counter(User, (instance.author_id,), 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(instance, **kwargs):
+    """Уменьшает число рецептов автора"""
+    change_counter(User, (instance.author_id,), 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def refresh_recipe_exists(instance, created=True, **kwargs):
+    """Сбрасывает кэш коротких ссылок при создании и удалении рецепта"""
+    if created:
+        invalidate_recipe_exists(instance.pk)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def increment_recipe_counter(sender, instance, created, **kwargs):
+    """Увеличивает счетчик избранного или списков покупок рецепта"""
+    if created:
+        change_counter(
+            Recipe, (instance.recipe_id,), RECIPE_COUNTERS[sender], 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def decrement_recipe_counter(sender, instance, **kwargs):
+    """Уменьшает счетчик избранного или списков покупок рецепта"""
+    change_counter(Recipe, (instance.recipe_id,), RECIPE_COUNTERS[sender], -1)
+
+
+@receiver(post_save, sender=Subscription)
+def increment_subscription_counters(instance, created, **kwargs):
+    """Увеличивает счетчики подписок и подписчиков"""
+    if created:
+        change_counter(
+            User, (instance.subscriber_id,), 'subscriptions_count', 1)
+        change_counter(
+            User, (instance.subscribed_to_id,), 'followers_count', 1)
+
+
+@receiver(post_delete, sender=Subscription)
+def decrement_subscription_counters(instance, **kwargs):
+    """Уменьшает счетчики подписок и подписчиков"""
+    change_counter(
+        User, (instance.subscriber_id,), 'subscriptions_count', -1)
+    change_counter(
+        User, (instance.subscribed_to_id,), 'followers_count', -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(instance, created, **kwargs):
+    """Добавляет продукты рецепта в список покупок пользователя"""
+    if created:
+        add_recipes_to_shopping_list(instance.user_id, (instance.recipe_id,))
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_from_shopping_list(instance, **kwargs):
+    """Убирает продукты рецепта из списка покупок пользователя,
+    пока состав рецепта еще не удален каскадно"""
+    remove_recipes_from_shopping_list(
+        instance.user_id, (instance.recipe_id,))
+
+
+@receiver(post_save, sender=Recipe)
+def process_recipe_image(instance, **kwargs):
+    """Запускает построение копий изображения рецепта"""
+    schedule_image_processing(instance, 'image')
+
+
+@receiver(post_save, sender=User)
+def process_avatar(instance, **kwargs):
+    """Запускает построение копий аватара"""
+    schedule_image_processing(instance, 'avatar')
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=User)
+def delete_image_renditions(sender, instance, **kwargs):
+    """Удаляет копии изображений удаленной записи"""
+    field_name = 'image' if sender is Recipe else 'avatar'
+    delete_renditions(
+        sender._meta.get_field(field_name).storage,
+        getattr(instance, f'{field_name}_renditions'))
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_vector(instance, **kwargs):
+    """Обновляет поисковый вектор сохраненного рецепта"""
+    update_search_vectors(Recipe.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def update_search_vector_on_ingredients(instance, **kwargs):
+    """Обновляет поисковый вектор при изменении продуктов рецепта,
+    кроме каскадного удаления состава вместе c рецептом"""
+    if instance.recipe_id not in get_deleting_recipes():
+        update_search_vectors(Recipe.objects.filter(pk=instance.recipe_id))
+
+
+@receiver(post_save, sender=Ingredient)
+def update_search_vectors_on_ingredient(instance, created, **kwargs):
+    """Обновляет поисковые векторы рецептов c переименованным продуктом"""
+    if not created:
+        update_search_vectors(Recipe.objects.filter(ingredients=instance))
+
+
+@receiver(post_save, sender=Recipe)
+def add_recipe_to_feeds(instance, created, **kwargs):
+    """Записывает новый рецепт в ленты подписчиков автора"""
+    if created:
+        fan_out_recipe(instance)
+
+
+@receiver(post_save, sender=Subscription)
+def add_author_to_feed(instance, created, **kwargs):
+    """Добавляет в ленту последние рецепты нового автора из подписок"""
+    if created:
+        backfill_feed(instance.subscriber_id, (instance.subscribed_to_id,))
+
+
+@receiver(post_delete, sender=Subscription)
+def remove_author_from_feed(instance, **kwargs):
+    """Убирает из ленты рецепты автора после отписки"""
+    trim_feed(instance.subscriber_id, (instance.subscribed_to_id,))
+
+
+@receiver(pre_save, sender=Recipe)
+def mark_similar_stale(instance, **kwargs):
+    """Отмечает сохраняемый рецепт для пересчета похожих рецептов"""
+    instance.similar_stale = True
+
+
+@receiver(pre_delete, sender=Recipe)
+def mark_similar_stale_on_delete(instance, **kwargs):
+    """Отмечает для пересчета рецепты, среди соседей которых
+    есть удаляемый рецепт"""
+    Recipe.objects.filter(id__in=SimilarRecipe.objects.filter(
+        similar=instance).values('recipe')).update(similar_stale=True)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def refresh_recipe_ingredients(instance, **kwargs):
+    """Обновляет индекс продуктов рецептов при записи рецепта.
+    Состав меняется пакетно, после чего рецепт сохраняется"""
+    invalidate_recipe_ingredients((instance.pk,))
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def refresh_recipe_ingredients_on_item(instance, **kwargs):
+    """Обновляет индекс продуктов при изменении строки состава рецепта.
+    При удалении рецепта индекс обновляется один раз по самому рецепту"""
+    if instance.recipe_id not in get_deleting_recipes():
+        invalidate_recipe_ingredients((instance.recipe_id,))
+
+
+@receiver(data_imported, sender=Recipe)
+def rebuild_recipe_ingredients(**kwargs):
+    """Перестраивает индекс продуктов рецептов после массовой загрузки"""
+    invalidate_recipe_ingredients()
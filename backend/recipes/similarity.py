@@ -0,0 +1,149 @@
+import math
+from collections import Counter, defaultdict
+from heapq import nlargest
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Recipe, RecipeIngredient, SimilarRecipe
+
+BATCH_SIZE = 1000
+METRICS = {
+    'cosine': lambda common, size, other: common / math.sqrt(size * other),
+    'jaccard': lambda common, size, other: common / (size + other - common),
+}
+
+
+def load_features():
+    """Строки разреженной матрицы рецепт × признак:
+    множества продуктов и тегов каждого рецепта"""
+    features = defaultdict(set)
+    for recipe_id, ingredient_id in RecipeIngredient.objects.values_list(
+            'recipe_id', 'ingredient_id').iterator():
+        features[recipe_id].add(('ingredient', ingredient_id))
+    for recipe_id, tag_id in Recipe.tags.through.objects.values_list(
+            'recipe_id', 'tag_id').iterator():
+        features[recipe_id].add(('tag', tag_id))
+    return features
+
+
+def build_index(features):
+    """Столбцы той же матрицы: рецепты по каждому признаку"""
+    index = defaultdict(list)
+    for recipe_id, recipe_features in features.items():
+        for feature in recipe_features:
+            index[feature].append(recipe_id)
+    return index
+
+
+def get_frequent(index):
+    """Признаки, которые есть больше чем
+    в SIMILAR_RECIPES_MAX_FEATURE_RECIPES рецептах. По ним не ищутся
+    кандидаты в соседи, но они учитываются в сходстве"""
+    return {
+        feature for feature, recipe_ids in index.items()
+        if len(recipe_ids) > settings.SIMILAR_RECIPES_MAX_FEATURE_RECIPES}
+
+
+def get_scores(recipe_id, features, index, frequent, metric):
+    """Сходство рецепта co всеми рецептами, у которых есть общие редкие
+    признаки. Число общих признаков считается по индексу, как произведение
+    строки матрицы на транспонированную матрицу"""
+    own = features.get(recipe_id, set())
+    own_frequent = own & frequent
+    common = Counter()
+    for feature in own - frequent:
+        common.update(index[feature])
+    common.pop(recipe_id, None)
+    return {
+        other: METRICS[metric](
+            count + len(own_frequent & features[other]),
+            len(own), len(features[other]))
+        for other, count in common.items()}
+
+
+def get_top(scores, count):
+    """count ближайших соседей, при равенстве сходства — c меньшим id"""
+    return nlargest(
+        count, scores.items(), key=lambda item: (item[1], -item[0]))
+
+
+def set_stale(recipe_ids, stale):
+    """Ставит или снимает отметку similar_stale пачками id"""
+    recipe_ids = list(recipe_ids)
+    for start in range(0, len(recipe_ids), BATCH_SIZE):
+        Recipe.objects.filter(
+            id__in=recipe_ids[start:start + BATCH_SIZE]
+        ).update(similar_stale=stale)
+
+
+def get_neighbours(stale, full, count, metric):
+    """Новые списки соседей устаревших рецептов и рецептов,
+    в чьих списках они есть или должны появиться"""
+    features = load_features()
+    index = build_index(features)
+    frequent = get_frequent(index)
+
+    def get_recipe_scores(recipe_id):
+        return get_scores(recipe_id, features, index, frequent, metric)
+
+    neighbours, merged = {}, defaultdict(dict)
+    for recipe_id in stale:
+        scores = get_recipe_scores(recipe_id)
+        neighbours[recipe_id] = get_top(scores, count)
+        if full:
+            continue
+        for other, score in scores.items():
+            if other not in stale:
+                merged[other][recipe_id] = score
+    if full:
+        return neighbours
+    listing_stale = set(SimilarRecipe.objects.filter(
+        similar_id__in=stale).values_list('recipe_id', flat=True))
+    for recipe_id in listing_stale - stale:
+        neighbours[recipe_id] = get_top(get_recipe_scores(recipe_id), count)
+    current = defaultdict(dict)
+    for recipe_id, similar_id, score in SimilarRecipe.objects.filter(
+            recipe_id__in=merged.keys() - neighbours.keys()
+    ).values_list('recipe_id', 'similar_id', 'score').iterator():
+        current[recipe_id][similar_id] = score
+    for recipe_id in merged.keys() - neighbours.keys():
+        top = get_top({**current[recipe_id], **merged[recipe_id]}, count)
+        if {pk for pk, _ in top} != current[recipe_id].keys():
+            neighbours[recipe_id] = top
+    return neighbours
+
+
+def refresh_similar_recipes(full=False):
+    """Пересчитывает соседей рецептов, отмеченных similar_stale,
+    и рецептов, в чьих списках они есть или должны появиться.
+    Отметка снимается до чтения признаков: рецепт, сохраненный
+    во время расчета, останется отмеченным до следующего запуска.
+    Возвращает число устаревших рецептов и обновленных списков"""
+    recipes = Recipe.objects.all()
+    if not full:
+        recipes = recipes.filter(similar_stale=True)
+    stale = set(recipes.values_list('id', flat=True))
+    if not stale:
+        return 0, 0
+    with transaction.atomic():
+        set_stale(stale, False)
+    try:
+        neighbours = get_neighbours(
+            stale, full, settings.SIMILAR_RECIPES_COUNT,
+            settings.SIMILAR_RECIPES_METRIC)
+        with transaction.atomic():
+            rows = SimilarRecipe.objects.all()
+            if not full:
+                rows = rows.filter(recipe_id__in=neighbours)
+            rows.delete()
+            SimilarRecipe.objects.bulk_create(
+                (SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id,
+                               score=score)
+                 for recipe_id, top in neighbours.items()
+                 for similar_id, score in top),
+                batch_size=BATCH_SIZE)
+    except BaseException:
+        set_stale(stale, True)
+        raise
+    return len(stale), len(neighbours)
@@ -0,0 +1,40 @@
+import threading
+
+
+from .models import Tag
+from .versions import bump_version, get_version
+
+TAGS_VERSION_KEY = 'tags:version'
+
+
+def invalidate_tag_slugs():
+    """Помечает кэш слагов тегов во всех процессах устаревшим"""
+    bump_version(TAGS_VERSION_KEY)
+
+
+class TagSlugs:
+    """Соответствие слагов и id тегов в памяти процесса.
+    Перечитывается при смене версии в общем кэше"""
+
+    def __init__(self):
+        self.version = None
+        self.ids = {}
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        """Перечитывает теги, если они изменились"""
+        version = get_version(TAGS_VERSION_KEY)
+        if version == self.version:
+            return
+        with self.lock:
+            if version != self.version:
+                self.ids = dict(Tag.objects.values_list('slug', 'id'))
+                self.version = version
+
+    def get_ids(self, slugs):
+        """Возвращает id тегов по слагам, неизвестные слаги пропускаются"""
+        self.refresh()
+        return {self.ids[slug] for slug in slugs if slug in self.ids}
+
+
+tag_slugs = TagSlugs()
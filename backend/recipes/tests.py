@@ -0,0 +1,286 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.admin import site
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import short_links, signals, similarity
+from .versions import get_version, increment
+from .admin_filters import CookingTimeFilter
+from .models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    SimilarRecipe,
+    Subscription,
+    Tag,
+    User
+)
+
+
+class ImportTest(TestCase):
+    """Импорт справочников c контрольными точками"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'tags.json')
+        self.data = json.dumps([
+            {'name': f'Тег {number}', 'slug': f'tag-{number}'}
+            for number in range(30)])
+
+    def import_tags(self, data, **options):
+        with open(self.path, 'w', encoding='utf-8') as file:
+            file.write(data)
+        call_command(
+            'import_tags', path=self.path, batch_size=10,
+            stdout=StringIO(), **options)
+
+    def test_broken_file_fails_and_resumes(self):
+        with self.assertRaisesMessage(CommandError, '--resume'):
+            self.import_tags(self.data[:-40])
+        self.assertEqual(Tag.objects.count(), 20)
+        self.assertTrue(os.path.exists(f'{self.path}.checkpoint'))
+        self.import_tags(self.data, resume=True)
+        self.assertEqual(Tag.objects.count(), 30)
+        self.assertFalse(os.path.exists(f'{self.path}.checkpoint'))
+
+
+class VersionsTest(TestCase):
+    """Версии данных в кэше"""
+
+    def test_evicted_version_does_not_repeat(self):
+        for reseed in (get_version, increment):
+            with self.subTest(reseed=reseed.__name__):
+                cache.clear()
+                seen = get_version('test:version')
+                cache.delete('test:version')
+                self.assertNotEqual(reseed('test:version'), seen)
+
+    def test_counter_starts_from_zero(self):
+        cache.delete('test:counter')
+        self.assertEqual(increment('test:counter'), 1)
+
+
+class CookingTimeFilterTest(TestCase):
+    """Границы фильтра по времени готовки"""
+
+    def get_bounds(self, histogram, use_quantiles=True):
+        time_filter = CookingTimeFilter(None, {}, Recipe, None)
+        time_filter.use_quantiles = use_quantiles
+        return time_filter.get_bounds(histogram)
+
+    def test_bounds(self):
+        histogram = [(time, 1) for time in range(1, 10)]
+        self.assertEqual(self.get_bounds(histogram, False), (3, 6))
+        self.assertEqual(self.get_bounds(histogram), (3, 6))
+        self.assertEqual(
+            self.get_bounds([(1, 5), (2, 5), (3, 5), (30, 1)]), (2, 3))
+
+    def test_skewed_quantiles_fall_back(self):
+        self.assertEqual(
+            self.get_bounds([(1, 1), (2, 1), (100, 100)]), (33, 66))
+
+    def test_quantiles_setting(self):
+        for enabled in (False, True):
+            with self.subTest(enabled=enabled), self.settings(
+                    COOKING_TIME_QUANTILES=enabled):
+                self.assertIs(
+                    CookingTimeFilter(None, {}, Recipe, None).use_quantiles,
+                    enabled)
+
+
+class AdminQueriesTest(TestCase):
+    """Число SQL-запросов в списках админ-панели
+    не зависит от числа строк на странице"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='password')
+        users = [
+            User.objects.create_user(
+                username=f'user-{number}', email=f'user-{number}@example.com',
+                password='password')
+            for number in range(3)]
+        tags = [
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag-{number}')
+            for number in range(3)]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Продукт {number}', measurement_unit='г')
+            for number in range(3)]
+        for number, user in enumerate(users):
+            recipe = Recipe.objects.create(
+                author=user, name=f'Рецепт {number}', text='Текст',
+                cooking_time=number + 1, image='recipes/images/test.png')
+            recipe.tags.set(tags[:number + 1])
+            for ingredient in ingredients[:number + 1]:
+                RecipeIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=1)
+            Subscription.objects.create(
+                subscriber=cls.admin, subscribed_to=user)
+            Favorite.objects.create(user=cls.admin, recipe=recipe)
+            ShoppingCart.objects.create(user=cls.admin, recipe=recipe)
+
+    def count_queries(self, model_admin, per_page):
+        model = model_admin.model
+        url = reverse(
+            f'admin:{model._meta.app_label}_{model._meta.model_name}'
+            '_changelist')
+        list_per_page = model_admin.list_per_page
+        model_admin.list_per_page = per_page
+        cache.clear()
+        try:
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get(url)
+        finally:
+            model_admin.list_per_page = list_per_page
+        self.assertEqual(response.status_code, 200)
+        return len(captured)
+
+    def test_changelists_without_queries_per_row(self):
+        self.client.force_login(self.admin)
+        for model, model_admin in site._registry.items():
+            if model._meta.app_label != 'recipes':
+                continue
+            with self.subTest(model=model.__name__):
+                self.assertGreater(model.objects.count(), 1)
+                self.assertEqual(
+                    self.count_queries(model_admin, 1),
+                    self.count_queries(model_admin, 100))
+
+
+class SimilarRecipesTest(TestCase):
+    """Пересчет похожих рецептов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='password')
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Продукт {number}', measurement_unit='г')
+            for number in range(3)]
+        cls.recipes = []
+        for number in range(3):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Текст',
+                cooking_time=1, image='recipes/images/test.png')
+            for ingredient in ingredients[number:]:
+                RecipeIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=1)
+            cls.recipes.append(recipe)
+
+    def test_recipe_saved_during_build_stays_stale(self):
+        first, second = self.recipes[:2]
+        load_features = similarity.load_features
+
+        def save_and_load():
+            for recipe in (first, second):
+                Recipe.objects.get(pk=recipe.pk).save()
+            return load_features()
+
+        Recipe.objects.filter(pk=second.pk).update(similar_stale=False)
+        with mock.patch.object(
+                similarity, 'load_features', side_effect=save_and_load):
+            similarity.refresh_similar_recipes()
+        self.assertEqual(
+            set(Recipe.objects.filter(similar_stale=True)), {first, second})
+        self.assertTrue(SimilarRecipe.objects.filter(recipe=first).exists())
+
+    def test_failed_build_keeps_stale(self):
+        with mock.patch.object(
+                similarity, 'load_features', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                similarity.refresh_similar_recipes(full=True)
+        self.assertEqual(
+            Recipe.objects.filter(similar_stale=True).count(), 3)
+
+
+class RecipeDeleteTest(TestCase):
+    """Удаление рецепта c составом"""
+
+    def test_cascade_does_not_refresh_per_item(self):
+        author = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='password')
+        recipe = Recipe.objects.create(
+            author=author, name='Рецепт', text='Текст', cooking_time=1,
+            image='recipes/images/test.png')
+        for number in range(5):
+            RecipeIngredient.objects.create(
+                recipe=recipe, amount=1, ingredient=Ingredient.objects.create(
+                    name=f'Продукт {number}', measurement_unit='г'))
+        with mock.patch(
+                'recipes.signals.invalidate_recipe_ingredients'
+        ) as refresh, mock.patch(
+                'recipes.signals.update_search_vectors') as update:
+            recipe_id = recipe.id
+            recipe.delete()
+        refresh.assert_called_once_with((recipe_id,))
+        update.assert_not_called()
+        self.assertFalse(signals.get_deleting_recipes())
+
+
+class ShortLinkTest(TestCase):
+    """Короткие ссылки на рецепты"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='password')
+        cls.recipe = Recipe.objects.create(
+            author=author, name='Рецепт', text='Текст', cooking_time=1,
+            image='recipes/images/test.png')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_codes(self):
+        for obfuscate in (False, True):
+            with self.subTest(obfuscate=obfuscate), self.settings(
+                    SHORT_LINK_OBFUSCATE=obfuscate):
+                for pk in (1, 61, 62, 12345, 10 ** 6):
+                    code = short_links.encode_code(pk)
+                    self.assertFalse(code.isdigit())
+                    self.assertEqual(short_links.decode_code(code), pk)
+                    wrong = ('b' if code[0] == 'a' else 'a') + code[1:]
+                    self.assertIsNone(short_links.decode_code(wrong))
+                for code in ('', 'a', '12', 'a!b'):
+                    self.assertIsNone(short_links.decode_code(code))
+
+    def test_redirects(self):
+        pk = self.recipe.id
+        code = short_links.encode_code(pk)
+        link = self.client.get(f'/api/recipes/{pk}/get-link/')
+        self.assertTrue(link.data['short-link'].endswith(f'/s/{code}/'))
+        for url in (f'/s/{code}/', f'/s/{pk}/'):
+            with self.subTest(url=url):
+                self.assertRedirects(
+                    self.client.get(url), f'/recipes/{pk}/',
+                    fetch_redirect_response=False)
+        short_links.click_buffer.flush()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.short_link_clicks, 2)
+
+    def test_missing_recipe(self):
+        missing = self.recipe.id + 1
+        for url in (f'/s/{short_links.encode_code(missing)}/',
+                    f'/s/{missing}/', '/s/0abc/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
@@ -1,9 +1,11 @@
 from django.urls import path
 
-from .views import redirect_to_recipe
+from .views import redirect_to_recipe, redirect_to_recipe_by_pk
 
 app_name = 'recipes'
 
 urlpatterns = [
-    path('s/<int:pk>/', redirect_to_recipe, name='redirect-to-recipe')
+    path('s/<int:pk>/', redirect_to_recipe_by_pk,
+         name='redirect-to-recipe-by-pk'),
+    path('s/<str:code>/', redirect_to_recipe, name='redirect-to-recipe'),
 ]
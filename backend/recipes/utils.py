@@ -1,28 +1,78 @@
+import csv
+import json
+
 from babel.dates import format_date
 from django.utils import timezone as tz
 
-SHOPPING_CART_TEMPLATE = (
-    'Список продуктов к покупке на {date} г.:\n'
-    '{products}\n'
-    '...\n'
-    'Составлен на основании рецептов:\n'
-    '{recipes}'
-)
-
-
-def get_shopping_cart_text(product_list, recipes):
-    """Генерирует текст со списком покупок"""
-    date = format_date(tz.now(), format='d MMMM yyyy', locale='ru')
-    products = '\n'.join(['{}. {} ({}) - {}.'.format(
-        index,
-        product['ingredient__name'].capitalize(),
-        product['ingredient__measurement_unit'],
-        product['total_amount'])
-        for index, product in enumerate(product_list, start=1)])
-    recipes_list = '\n'.join(['{}. {} (@{})'.format(
-        index,
-        recipe.name,
-        recipe.author.username)
-        for index, recipe in enumerate(recipes, start=1)])
-    return SHOPPING_CART_TEMPLATE.format(
-        date=date, products=products, recipes=recipes_list)
+SHOPPING_CART_HEADER = 'Список продуктов к покупке на {date} г.:\n'
+SHOPPING_CART_PRODUCT = '{index}. {name} ({unit}) - {amount}.\n'
+SHOPPING_CART_RECIPES_HEADER = '...\nСоставлен на основании рецептов:\n'
+SHOPPING_CART_RECIPE = '{index}. {name} (@{author})\n'
+
+SHOPPING_CART_RENDERERS = {}
+
+
+def register_shopping_cart_renderer(format, content_type):
+    """Регистрирует генератор файла списка покупок для формата"""
+    def decorator(renderer):
+        SHOPPING_CART_RENDERERS[format] = (renderer, content_type)
+        return renderer
+    return decorator
+
+
+def get_shopping_cart_date():
+    """Возвращает текущую дату для заголовка списка покупок"""
+    return format_date(tz.now(), format='d MMMM yyyy', locale='ru')
+
+
+@register_shopping_cart_renderer('txt', 'text/plain; charset=utf-8')
+def render_shopping_cart_txt(products, recipes):
+    """Построчно генерирует текст со списком покупок"""
+    yield SHOPPING_CART_HEADER.format(date=get_shopping_cart_date())
+    for index, product in enumerate(products, start=1):
+        yield SHOPPING_CART_PRODUCT.format(
+            index=index,
+            name=product['ingredient__name'].capitalize(),
+            unit=product['ingredient__measurement_unit'],
+            amount=product['total_amount'])
+    yield SHOPPING_CART_RECIPES_HEADER
+    for index, recipe in enumerate(recipes, start=1):
+        yield SHOPPING_CART_RECIPE.format(
+            index=index, name=recipe.name, author=recipe.author.username)
+
+
+class EchoBuffer:
+    """Буфер для csv.writer, возвращающий записанную строку"""
+    def write(self, value):
+        return value
+
+
+@register_shopping_cart_renderer('csv', 'text/csv; charset=utf-8')
+def render_shopping_cart_csv(products, recipes):
+    """Построчно генерирует CSV со списком покупок"""
+    writer = csv.writer(EchoBuffer())
+    yield writer.writerow(('Продукт', 'Единица измерения', 'Количество'))
+    for product in products:
+        yield writer.writerow((
+            product['ingredient__name'].capitalize(),
+            product['ingredient__measurement_unit'],
+            product['total_amount']))
+
+
+@register_shopping_cart_renderer('json', 'application/json')
+def render_shopping_cart_json(products, recipes):
+    """Генерирует JSON со списком покупок по одному объекту за раз"""
+    yield '{{"date": {}, "products": ['.format(
+        json.dumps(get_shopping_cart_date(), ensure_ascii=False))
+    for index, product in enumerate(products):
+        yield ', ' * bool(index) + json.dumps({
+            'name': product['ingredient__name'],
+            'measurement_unit': product['ingredient__measurement_unit'],
+            'amount': product['total_amount']}, ensure_ascii=False)
+    yield '], "recipes": ['
+    for index, recipe in enumerate(recipes):
+        yield ', ' * bool(index) + json.dumps({
+            'id': recipe.id,
+            'name': recipe.name,
+            'author': recipe.author.username}, ensure_ascii=False)
+    yield ']}'
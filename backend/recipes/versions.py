@@ -0,0 +1,35 @@
+import time
+
+from django.core.cache import cache as default_cache
+from django.db import transaction
+
+
+def get_version(key, cache=default_cache):
+    """Возвращает версию данных из кэша. Отсутствующая версия заводится
+    по текущему времени, чтобы после вытеснения ключа не совпасть
+    c версией, которую процесс уже видел"""
+    cache.add(key, time.time_ns(), timeout=None)
+    return cache.get(key)
+
+
+def increment(key, cache=default_cache, start=0):
+    """Атомарно увеличивает счетчик в кэше и возвращает новое значение.
+    Отсутствующий счетчик заводится co значением start"""
+    cache.add(key, start, timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, start + 1, timeout=None)
+        return start + 1
+
+
+def bump_version(key, cache=default_cache, callback=None):
+    """Увеличивает версию данных в кэше после фиксации транзакции.
+    Процессы сравнивают ее co своей и перечитывают данные, поэтому
+    для нескольких процессов нужен разделяемый бэкенд кэша.
+    callback получает новую версию"""
+    def bump():
+        version = increment(key, cache, time.time_ns())
+        if callback is not None:
+            callback(version)
+    transaction.on_commit(bump)
@@ -1,11 +1,20 @@
 from django.http import Http404
 from django.shortcuts import redirect
 
-from recipes.models import Recipe
+from .short_links import click_buffer, decode_code, recipe_exists
 
 
-def redirect_to_recipe(request, pk):
+def redirect_to_recipe(request, code):
     """Функция перенаправляет запрос с короткого адреса на основной"""
-    if not Recipe.objects.filter(pk=pk).exists():
+    pk = decode_code(code)
+    if pk is None:
+        raise Http404(f'Неверный код короткой ссылки {code}')
+    return redirect_to_recipe_by_pk(request, pk)
+
+
+def redirect_to_recipe_by_pk(request, pk):
+    """Перенаправление по старым ссылкам вида /s/<pk>/"""
+    if not recipe_exists(pk):
         raise Http404(f'Рецепта с pk={pk} не существует')
+    click_buffer.add(pk)
     return redirect(f'/recipes/{pk}/')